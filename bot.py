@@ -5,7 +5,7 @@ import pyromod.listen
 from pyrogram import Client
 from pyrogram.enums import ParseMode
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 #neel_leen on Tg
 from config import *
 import subprocess
@@ -14,6 +14,17 @@ import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from database.database import db  # <-- added import
+from helper_func import invite_links, channel_registry, run_deletion_reaper, BackupWriter, backup_collections
+
+
+# Collections that only grow or carry a write timestamp: nightly backups export
+# just the documents whose field is past the previous run's watermark
+BACKUP_WATERMARKS = {
+    "users": "joined",
+    "request_forcesub_user": "created_at",
+    "request_forcesub_channel": "updated_at",
+    "batch_manifests": "created_at",
+}
 
 
 name ="""
@@ -37,6 +48,14 @@ class Bot(Client):
         self.scheduler = AsyncIOScheduler()
 
     async def start(self):
+        # Admin/ban checks read from memory, so the index must be ready before updates arrive
+        await db.load_acl()
+        await db.ensure_indexes()
+        db.start_user_writer()
+        if db.req_storage == "docs":
+            await db.migrate_req_users()
+        # Channel ids and modes first, so force-sub updates are filtered from the first one
+        await channel_registry.refresh()
         await super().start()
         usr_bot_me = await self.get_me()
         self.uptime = datetime.now()
@@ -65,14 +84,30 @@ class Bot(Client):
         await app.setup()
         await web.TCPSite(app, "0.0.0.0", PORT).start()
 
+        # Fill force-sub chat titles/usernames and keep links topped up in the background
+        channel_registry.start(self)
+        invite_links.start(self)
+
+        # Delete queued messages (auto-delete timers, timed broadcasts) once they are due,
+        # starting with anything that fell due while the bot was offline
+        asyncio.create_task(run_deletion_reaper(self))
+
+        # Pick up /delreq reconciliations and broadcasts interrupted by a restart
+        # (with JOB_WORKER set these are queued for worker.py instead)
+        from plugins.request_fsub import resume_delreq_jobs
+        from plugins.broadcast import resume_broadcasts
+        await resume_delreq_jobs(self)
+        await resume_broadcasts(self)
+
         # Start Daily Backup Scheduler
-        self.scheduler.add_job(self.daily_backup, CronTrigger(hour=0, minute=0))  # Daily at midnight
+        self.scheduler.add_job(self.scheduled_backup, CronTrigger(hour=0, minute=0))  # Daily at midnight
         self.scheduler.start()
 
         try: await self.send_message(OWNER_ID, text = f"<b><blockquote> Bᴏᴛ Rᴇsᴛᴀʀᴛᴇᴅ by @BeingHumanAssociation</blockquote></b>")
         except: pass
 
     async def stop(self, *args):
+        await db.flush_users()
         await super().stop()
         self.LOGGER(__name__).info("Bot stopped.")
 
@@ -88,13 +123,24 @@ class Bot(Client):
         finally:
             loop.run_until_complete(self.stop())
 
-    async def daily_backup(self, chat_id=None, mode: str = "json"):
-        """Create a zipped backup of MongoDB collections and send it.
-        mode = 'json' (default) exports newline-delimited extended JSON.
+    async def scheduled_backup(self):
+        if JOB_WORKER:
+            # One job per day even if several bot instances fire the trigger
+            await db.enqueue_job(
+                'backup', key=f"backup:{datetime.utcnow():%Y-%m-%d}", chat_id=OWNER_ID, mode="json", incremental=True
+            )
+        else:
+            await self.daily_backup(incremental=True)
+
+    async def daily_backup(self, chat_id=None, mode: str = "json", incremental: bool = False, raise_errors: bool = False):
+        """Create a backup of MongoDB collections and send it.
+        mode = 'json' (default) streams gzip-compressed NDJSON volumes of at most BACKUP_VOLUME_SIZE bytes.
         mode = 'bson' attempts to use 'mongodump' (if available). Falls back to json on failure.
+        incremental = True (nightly run) exports only documents written since the last run for the
+        collections in BACKUP_WATERMARKS, with a full base every BACKUP_FULL_EVERY days.
+        raise_errors = True re-raises a failure after reporting it, so a queued job is retried.
         """
-        import tempfile, json, shutil
-        from bson.json_util import dumps as bson_dumps
+        import tempfile, shutil
 
         if chat_id is None:
             chat_id = OWNER_ID
@@ -116,14 +162,17 @@ class Bot(Client):
                         "--uri", DB_URI,
                         "--out", dump_out
                     ]
-                    subprocess.run(dump_cmd, check=True)
-                    # Zip bson dump
-                    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                        for root, _, files in os.walk(dump_out):
-                            for f in files:
-                                full = os.path.join(root, f)
-                                arc = os.path.relpath(full, dump_out)
-                                zf.write(full, arc)
+                    await asyncio.to_thread(subprocess.run, dump_cmd, check=True)
+
+                    # Zip bson dump (off the event loop)
+                    def zip_dump():
+                        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                            for root, _, files in os.walk(dump_out):
+                                for f in files:
+                                    full = os.path.join(root, f)
+                                    arc = os.path.relpath(full, dump_out)
+                                    zf.write(full, arc)
+                    await asyncio.to_thread(zip_dump)
                     caption = "📦 MongoDB Backup (BSON)"
                 except (FileNotFoundError, subprocess.CalledProcessError) as e:
                     # Fallback to JSON export
@@ -134,41 +183,57 @@ class Bot(Client):
                     mode = "json"
 
             if mode == "json":
-                collections = {
-                    "channels.jsonl": db.channel_data,
-                    "admins.jsonl": db.admins_data,
-                    "users.jsonl": db.user_data,
-                    "banned_user.jsonl": db.banned_user_data,
-                    "autho_user.jsonl": db.autho_user_data,
-                    "del_timer.jsonl": db.del_timer_data,
-                    "fsub.jsonl": db.fsub_data,
-                    "request_forcesub.jsonl": db.rqst_fsub_data,
-                    "request_forcesub_channel.jsonl": db.rqst_fsub_Channel_data,
-                }
-                for filename, collection in collections.items():
-                    file_path = os.path.join(work_dir, filename)
+                collections = backup_collections()
+                parts = []
+                run_started = datetime.utcnow()
+                state = await db.get_backup_state() if incremental else {}
+                base_at = state.get('_base', {}).get('at')
+                since_base = incremental and base_at and run_started - base_at < timedelta(days=BACKUP_FULL_EVERY)
+                kind = "incremental" if since_base else "export"
+
+                async def send_volume(path):
+                    parts.append(path)
+                    await self.send_document(
+                        chat_id=chat_id,
+                        document=path,
+                        caption=f"📦 MongoDB Backup (JSON {kind}) — part {len(parts)}"
+                    )
+                    os.remove(path)
+
+                writer = BackupWriter(
+                    work_dir, f"mongodb_backup_{kind}_{datetime.now():%Y%m%d_%H%M}", BACKUP_VOLUME_SIZE, send_volume
+                )
+                failed = set()
+                for collection in collections:
+                    query = {}
+                    field = BACKUP_WATERMARKS.get(collection.name)
+                    watermark = state.get(collection.name, {}).get('watermark')
+                    if since_base and field and watermark:
+                        query = {field: {'$gte': watermark}}
                     try:
-                        async for doc in collection.find({}):
-                            with open(file_path, 'a', encoding='utf-8') as f:
-                                f.write(bson_dumps(doc))
-                                f.write('\n')
+                        async for doc in collection.find(query, batch_size=1000):
+                            await writer.write(collection.name, doc)
                     except Exception as e:
-                        with open(file_path, 'a', encoding='utf-8') as f:
-                            f.write(json.dumps({"_error": str(e)}))
-                            f.write('\n')
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                    for root, _, files in os.walk(work_dir):
-                        for f in files:
-                            if f.endswith('.jsonl'):
-                                full = os.path.join(root, f)
-                                zf.write(full, f)
-                caption = "📦 MongoDB Backup (JSON export)"
-
-            await self.send_document(
-                chat_id=chat_id,
-                document=zip_path,
-                caption=caption
-            )
+                        failed.add(collection.name)
+                        await writer.write(collection.name, {"_error": str(e)})
+                await writer.close()
+
+                # Watermarks only move once every volume is delivered; the overlap
+                # covers writes stamped just before this run but committed after it.
+                # A collection whose export broke keeps its old watermark, and a
+                # base with any broken collection is not a base.
+                if incremental:
+                    for name in BACKUP_WATERMARKS:
+                        if name not in failed:
+                            await db.save_backup_state(name, watermark=run_started - timedelta(minutes=5))
+                    if not since_base and not failed:
+                        await db.save_backup_state('_base', at=run_started)
+            else:
+                await self.send_document(
+                    chat_id=chat_id,
+                    document=zip_path,
+                    caption=caption
+                )
             self.LOGGER(__name__).info("Backup sent successfully.")
         except Exception as e:
             self.LOGGER(__name__).error(f"Backup failed: {e}")
@@ -176,6 +241,8 @@ class Bot(Client):
                 await self.send_message(chat_id, f"❌ Backup failed: {e}")
             except:
                 pass
+            if raise_errors:
+                raise
         finally:
             try:
                 shutil.rmtree(work_dir, ignore_errors=True)
@@ -21,6 +21,49 @@ DB_URI = os.environ.get("DATABASE_URL", "") # MongoDB connection string
 DB_NAME = os.environ.get("DATABASE_NAME", "FileStoreBot") # Database name
 #--------------------------------------------
 FSUB_LINK_EXPIRY = int(os.getenv("FSUB_LINK_EXPIRY", "0"))  # 0 means no expiry
+FSUB_CACHE_TTL = int(os.getenv("FSUB_CACHE_TTL", "300"))  # seconds a confirmed membership is trusted
+FSUB_NEG_CACHE_TTL = int(os.getenv("FSUB_NEG_CACHE_TTL", "10"))  # seconds a 'not joined' result is reused
+FSUB_JOIN_WAIT = float(os.getenv("FSUB_JOIN_WAIT", "2"))  # max seconds to wait for a pending join request
+FSUB_LINK_POOL_SIZE = int(os.getenv("FSUB_LINK_POOL_SIZE", "3"))  # invite links kept ready per channel and mode
+FSUB_REGISTRY_TTL = int(os.getenv("FSUB_REGISTRY_TTL", "600"))  # seconds between force-sub channel refreshes
+REQ_STORAGE = os.getenv("REQ_STORAGE", "array").lower()  # array | docs (one document per channel/user join request)
+REQ_USER_TTL = int(os.getenv("REQ_USER_TTL", "0"))  # docs mode: seconds before a stored join request expires, 0 = never
+DELREQ_CONCURRENCY = int(os.getenv("DELREQ_CONCURRENCY", "8"))  # parallel get_chat_member calls during /delreq
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "0.3"))  # seconds between bulk upserts of new users
+SEEN_USERS_CACHE = int(os.getenv("SEEN_USERS_CACHE", "500000"))  # user ids remembered as already stored
+MESSAGE_CACHE_BYTES = int(os.getenv("MESSAGE_CACHE_BYTES", str(64 * 1024 * 1024)))  # approx. memory for cached DB channel messages
+MESSAGE_CACHE_TTL = int(os.getenv("MESSAGE_CACHE_TTL", "0"))  # seconds a cached message stays valid, 0 = until evicted
+#--------------------------------------------
+# Broadcast engine
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))  # parallel senders
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # messages per second across all senders, within SEND_RATE
+BROADCAST_BATCH = int(os.getenv("BROADCAST_BATCH", "500"))  # users per checkpoint
+DELETE_REAPER_INTERVAL = float(os.getenv("DELETE_REAPER_INTERVAL", "5"))  # seconds between scheduled-deletion sweeps
+DELETE_REAPER_CONCURRENCY = int(os.getenv("DELETE_REAPER_CONCURRENCY", "10"))  # chats whose deletions run at once
+#--------------------------------------------
+# File delivery
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "1"))  # parallel sends per /start, >1 may reorder files
+DELIVERY_MIN_INTERVAL = float(os.getenv("DELIVERY_MIN_INTERVAL", "0.05"))  # fastest spacing between sends to one chat
+DELIVERY_MAX_INTERVAL = float(os.getenv("DELIVERY_MAX_INTERVAL", "3"))  # slowest spacing after that chat's repeated FloodWaits
+#--------------------------------------------
+# Send gateway (every outgoing send/copy/delete)
+SEND_RATE = float(os.getenv("SEND_RATE", "28"))  # calls per second across the bot
+SEND_MIN_RATE = float(os.getenv("SEND_MIN_RATE", "5"))  # floor the rate backs off to after repeated FloodWaits
+SEND_CHAT_INTERVAL = float(os.getenv("SEND_CHAT_INTERVAL", "1"))  # fixed spacing between broadcast sends to one chat
+#--------------------------------------------
+# Job worker (python3 worker.py)
+JOB_WORKER = os.environ.get("JOB_WORKER", "False") == "True"  # hand broadcasts, /delreq, backups and batch buttons to the worker
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))  # jobs one worker runs at a time
+JOB_LEASE = int(os.getenv("JOB_LEASE", "120"))  # seconds a claimed job stays owned without a heartbeat
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # tries before a job is marked failed
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))  # seconds between queue polls when idle
+SEND_RESERVE = float(os.getenv("SEND_RESERVE", "8"))  # calls per second of SEND_RATE the worker leaves to the bot
+BACKUP_VOLUME_SIZE = int(os.getenv("BACKUP_VOLUME_SIZE", str(1900 * 1024 * 1024)))  # max bytes per backup file, under the upload limit
+BACKUP_FULL_EVERY = int(os.getenv("BACKUP_FULL_EVERY", "7"))  # days between full nightly backups, incremental in between
+#--------------------------------------------
+# File links
+LINK_SECRET = os.environ.get("LINK_SECRET", "")  # signs /start links; defaults to the bot token, set it to survive token changes
+LEGACY_LINKS = os.environ.get("LEGACY_LINKS", "True") == "True"  # keep accepting old unsigned get-/batch- links
 BAN_SUPPORT = os.environ.get("BAN_SUPPORT", "https://t.me/BeingHumanAssociation") # Your support group link
 TG_BOT_WORKERS = int(os.environ.get("TG_BOT_WORKERS", "200"))
 #--------------------------------------------
@@ -1,6 +1,8 @@
 #BEING HUMAN ASSOCIATION
 #NEEL_LEEN on Tg
 
+import asyncio
+import base64
 import motor.motor_asyncio
 import pymongo
 import certifi
@@ -8,8 +10,10 @@ import os
 import time
 import logging
 import sys, io
-from config import DB_URI, DB_NAME
-from pymongo.errors import ServerSelectionTimeoutError
+from datetime import datetime, timedelta
+from config import DB_URI, DB_NAME, REQ_STORAGE, REQ_USER_TTL, USER_FLUSH_INTERVAL, SEEN_USERS_CACHE
+from pymongo import UpdateOne, ASCENDING, ReturnDocument
+from pymongo.errors import ServerSelectionTimeoutError, OperationFailure, BulkWriteError, DuplicateKeyError
 
 logging.basicConfig(level=logging.INFO)
 
@@ -68,6 +72,13 @@ class Neel:
         self.fsub_data = self.database['fsub']
         self.rqst_fsub_data = self.database['request_forcesub']
         self.rqst_fsub_Channel_data = self.database['request_forcesub_channel']
+        self.rqst_fsub_user_data = self.database['request_forcesub_user']
+        self.delreq_job_data = self.database['delreq_jobs']
+        self.broadcast_data = self.database['broadcasts']
+        self.delete_queue_data = self.database['delete_queue']
+        self.job_data = self.database['jobs']
+        self.backup_state_data = self.database['backup_state']
+        self.batch_manifest_data = self.database['batch_manifests']
         self.protect_content_data = self.database['protect_content']
         self.caption_replace_data = self.database['caption_replace']
         self.global_caption_data = self.database['global_caption']
@@ -76,6 +87,25 @@ class Neel:
         self.caption_append_data = self.database['caption_append']
         self.caption_strip_data = self.database['caption_strip']
 
+        # Delivery settings snapshot, kept in memory and dropped by every setter
+        self._settings = None
+        self._settings_version = 0
+        self._settings_lock = asyncio.Lock()
+
+        # Admin / banned id sets, filled by load_acl() at startup
+        self.admin_ids = set()
+        self.banned_ids = set()
+
+        # 'array': user_ids list per channel document, 'docs': one document per (channel, user)
+        self.req_storage = REQ_STORAGE if REQ_STORAGE in ("array", "docs") else "array"
+        self._req_queue = []
+        self._req_flush = None
+
+        # Users known to be stored, and new ones waiting for the next bulk upsert
+        self.seen_users = set()
+        self._user_queue = set()
+        self._user_writer = None
+
     # USER DATA
     async def present_user(self, user_id: int):
         return bool(await self.user_data.find_one({'_id': user_id}))
@@ -83,11 +113,77 @@ class Neel:
     async def add_user(self, user_id: int):
         await self.user_data.insert_one({'_id': user_id})
 
-    async def full_userbase(self):
-        docs = await self.user_data.find().to_list(length=None)
-        return [doc['_id'] for doc in docs]
+    def register_user(self, user_id: int):
+        """Record a user without waiting on Mongo; new ids are upserted by the background writer."""
+        if user_id in self.seen_users:
+            return
+        if len(self.seen_users) >= SEEN_USERS_CACHE:
+            self.seen_users.clear()  # upserts are idempotent, forgetting only costs a write
+        self.seen_users.add(user_id)
+        self._user_queue.add(user_id)
+
+    async def flush_users(self):
+        if not self._user_queue:
+            return
+        batch, self._user_queue = self._user_queue, set()
+        now = datetime.utcnow()
+        ops = [UpdateOne({'_id': uid}, {'$setOnInsert': {'joined': now}}, upsert=True) for uid in batch]
+        try:
+            await self._upsert_bulk(self.user_data, ops)
+        except Exception as e:
+            logging.error(f"[DB ERROR] Failed to store {len(batch)} new users: {e}")
+            self._user_queue |= batch
+
+    async def _user_writer_loop(self):
+        while True:
+            await asyncio.sleep(USER_FLUSH_INTERVAL)
+            await self.flush_users()
+
+    def start_user_writer(self):
+        if self._user_writer is None:
+            self._user_writer = asyncio.create_task(self._user_writer_loop())
+
+    async def iter_user_ids(self, batch_size: int = 1000, after: int | None = None, limit: int = 0):
+        """Yield user ids greater than `after` in _id order, `batch_size` documents per round trip."""
+        query = {'_id': {'$gt': after}} if after is not None else {}
+        cursor = self.user_data.find(query, {'_id': 1}).sort('_id', ASCENDING).batch_size(batch_size).limit(limit)
+        async for doc in cursor:
+            yield doc['_id']
+
+    async def get_user_ids_page(self, after: int | None, limit: int):
+        """One broadcast checkpoint's worth of user ids, fetched in a single round trip."""
+        return [user_id async for user_id in self.iter_user_ids(batch_size=limit, after=after, limit=limit)]
+
+    async def count_users(self):
+        return await self.user_data.estimated_document_count()
+
+    # BROADCAST JOBS
+    async def create_broadcast(self, **fields):
+        fields.update({
+            'status': 'running', 'cursor': None, 'created_at': datetime.utcnow(),
+            'total': 0, 'successful': 0, 'blocked': 0, 'deleted': 0, 'unsuccessful': 0,
+        })
+        result = await self.broadcast_data.insert_one(fields)
+        return result.inserted_id
+
+    async def get_broadcast(self, job_id):
+        return await self.broadcast_data.find_one({'_id': job_id})
+
+    async def get_running_broadcasts(self):
+        return await self.broadcast_data.find({'status': 'running'}).to_list(length=None)
+
+    async def update_broadcast(self, job_id, inc: dict | None = None, **fields):
+        update = {}
+        if fields:
+            update['$set'] = fields
+        if inc:
+            update['$inc'] = inc
+        if update:
+            await self.broadcast_data.update_one({'_id': job_id}, update)
 
     async def del_user(self, user_id: int):
+        self.seen_users.discard(user_id)
+        self._user_queue.discard(user_id)
         await self.user_data.delete_one({'_id': user_id})
 
     # ADMIN DATA
@@ -97,10 +193,12 @@ class Neel:
     async def add_admin(self, admin_id: int):
         if not await self.admin_exist(admin_id):
             await self.admins_data.insert_one({'_id': admin_id})
+        self.admin_ids.add(admin_id)
 
     async def del_admin(self, admin_id: int):
         if await self.admin_exist(admin_id):
             await self.admins_data.delete_one({'_id': admin_id})
+        self.admin_ids.discard(admin_id)
 
     async def get_all_admins(self):
         docs = await self.admins_data.find().to_list(length=None)
@@ -113,21 +211,96 @@ class Neel:
     async def add_ban_user(self, user_id: int):
         if not await self.ban_user_exist(user_id):
             await self.banned_user_data.insert_one({'_id': user_id})
+        self.banned_ids.add(user_id)
 
     async def del_ban_user(self, user_id: int):
         if await self.ban_user_exist(user_id):
             await self.banned_user_data.delete_one({'_id': user_id})
+        self.banned_ids.discard(user_id)
 
     async def get_ban_users(self):
         docs = await self.banned_user_data.find().to_list(length=None)
         return [doc['_id'] for doc in docs]
 
+    # ACL INDEX
+    async def load_acl(self):
+        admins, banned = await asyncio.gather(self.get_all_admins(), self.get_ban_users())
+        self.admin_ids = set(admins)
+        self.banned_ids = set(banned)
+        logging.info(f"[DB] ACL loaded: {len(self.admin_ids)} admins, {len(self.banned_ids)} banned users")
+
+    def is_admin(self, user_id: int):
+        return user_id in self.admin_ids
+
+    def is_banned(self, user_id: int):
+        return user_id in self.banned_ids
+
+    # SETTINGS SNAPSHOT
+    def invalidate_settings(self):
+        self._settings = None
+        self._settings_version += 1
+
+    async def get_settings(self):
+        """Return every delivery setting as one dict, reading Mongo only after a change."""
+        if self._settings is not None:
+            return self._settings
+        async with self._settings_lock:
+            if self._settings is not None:
+                return self._settings
+            version = self._settings_version
+            settings = await self._load_settings()
+            settings['version'] = version
+            # A setter that ran while we were loading makes this snapshot stale already
+            if version == self._settings_version:
+                self._settings = settings
+            return settings
+
+    async def _load_settings(self):
+        if not await self.protect_content_data.find_one({}):
+            initial_protect = os.environ.get('PROTECT_CONTENT', "True").lower() == "true"
+            await self.protect_content_data.insert_one({'value': initial_protect})
+
+        (
+            del_timer,
+            protect_content,
+            (replace_old, replace_new),
+            (global_cap_text, global_cap_enabled),
+            (link_old, link_new),
+            (all_link, all_link_enabled),
+            caption_append,
+            strip_links,
+        ) = await asyncio.gather(
+            self.get_del_timer(),
+            self.get_protect_content(),
+            self.get_caption_replace(),
+            self.get_global_caption(),
+            self.get_link_replace(),
+            self.get_replace_all_link(),
+            self.get_caption_append(),
+            self.get_caption_strip(),
+        )
+        return {
+            'del_timer': del_timer,
+            'protect_content': protect_content,
+            'replace_old': replace_old,
+            'replace_new': replace_new,
+            'global_cap_text': global_cap_text,
+            'global_cap_enabled': global_cap_enabled,
+            'link_old': link_old,
+            'link_new': link_new,
+            'all_link': all_link,
+            'all_link_enabled': all_link_enabled,
+            'caption_append': caption_append,
+            'strip_links': strip_links,
+        }
+
     # AUTO DELETE TIMER SETTINGS
     async def set_del_timer(self, value: int):
         if await self.del_timer_data.find_one({}):
             await self.del_timer_data.update_one({}, {'$set': {'value': value}})
         else:
             await self.del_timer_data.insert_one({'value': value})
+        self.invalidate_settings()
 
     async def get_del_timer(self):
         data = await self.del_timer_data.find_one({})
@@ -139,6 +312,7 @@ class Neel:
             await self.protect_content_data.update_one({}, {'$set': {'value': value}})
         else:
             await self.protect_content_data.insert_one({'value': value})
+        self.invalidate_settings()
 
     async def get_protect_content(self):
         data = await self.protect_content_data.find_one({})
@@ -154,6 +328,7 @@ class Neel:
             )
         else:
             await self.caption_replace_data.delete_one({})
+        self.invalidate_settings()
 
     async def get_caption_replace(self):
         data = await self.caption_replace_data.find_one({})
@@ -170,6 +345,7 @@ class Neel:
             update['enabled'] = enabled
         if update:
             await self.global_caption_data.update_one({}, {'$set': update}, upsert=True)
+        self.invalidate_settings()
 
     async def get_global_caption(self):
         data = await self.global_caption_data.find_one({})
@@ -187,6 +363,7 @@ class Neel:
             )
         else:
             await self.link_replace_data.delete_one({})
+        self.invalidate_settings()
 
     async def get_link_replace(self):
         data = await self.link_replace_data.find_one({})
@@ -202,6 +379,7 @@ class Neel:
             update['enabled'] = enabled
         if update:
             await self.replace_all_link_data.update_one({}, {'$set': update}, upsert=True)
+        self.invalidate_settings()
 
     async def get_replace_all_link(self):
         data = await self.replace_all_link_data.find_one({})
@@ -214,6 +392,7 @@ class Neel:
             await self.caption_append_data.update_one({}, {'$set': {'text': text}}, upsert=True)
         else:
             await self.caption_append_data.delete_one({})
+        self.invalidate_settings()
 
     async def get_caption_append(self):
         data = await self.caption_append_data.find_one({})
@@ -221,6 +400,7 @@ class Neel:
 
     async def set_caption_strip(self, enabled: bool):
         await self.caption_strip_data.update_one({}, {'$set': {'enabled': enabled}}, upsert=True)
+        self.invalidate_settings()
 
     async def get_caption_strip(self):
         data = await self.caption_strip_data.find_one({})
@@ -242,6 +422,10 @@ class Neel:
         docs = await self.fsub_data.find().to_list(length=None)
         return [doc['_id'] for doc in docs]
 
+    async def get_fsub_channels(self):
+        docs = await self.fsub_data.find().to_list(length=None)
+        return {doc['_id']: doc.get("mode", "off") for doc in docs}
+
     async def get_channel_mode(self, channel_id: int):
         data = await self.fsub_data.find_one({'_id': channel_id})
         return data.get("mode", "off") if data else "off"
@@ -253,34 +437,339 @@ class Neel:
             upsert=True
         )
 
+    async def _upsert_bulk(self, collection, ops):
+        try:
+            await collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys only mean a concurrent upsert stored the same document first
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+
     # REQUEST FORCE-SUB MANAGEMENT
     async def req_user(self, channel_id: int, user_id: int):
         try:
-            await self.rqst_fsub_Channel_data.update_one(
-                {'_id': int(channel_id)},
-                {'$addToSet': {'user_ids': int(user_id)}},
-                upsert=True
-            )
+            if self.req_storage == "docs":
+                await self.rqst_fsub_user_data.update_one(
+                    {'channel_id': int(channel_id), 'user_id': int(user_id)},
+                    {'$setOnInsert': {'created_at': datetime.utcnow()}},
+                    upsert=True
+                )
+            else:
+                await self.rqst_fsub_Channel_data.update_one(
+                    {'_id': int(channel_id)},
+                    {'$addToSet': {'user_ids': int(user_id)}, '$set': {'updated_at': datetime.utcnow()}},
+                    upsert=True
+                )
         except Exception as e:
             logging.error(f"[DB ERROR] Failed to add user to request list: {e}")
 
+    async def req_users_bulk(self, pairs):
+        """Store many (channel_id, user_id) join requests with a single unordered bulk_write."""
+        if not pairs:
+            return
+        if self.req_storage == "docs":
+            now = datetime.utcnow()
+            ops = [
+                UpdateOne(
+                    {'channel_id': int(channel_id), 'user_id': int(user_id)},
+                    {'$setOnInsert': {'created_at': now}},
+                    upsert=True
+                )
+                for channel_id, user_id in set(pairs)
+            ]
+            await self._upsert_bulk(self.rqst_fsub_user_data, ops)
+        else:
+            now = datetime.utcnow()
+            by_channel = {}
+            for channel_id, user_id in pairs:
+                by_channel.setdefault(int(channel_id), set()).add(int(user_id))
+            ops = [
+                UpdateOne(
+                    {'_id': channel_id},
+                    {'$addToSet': {'user_ids': {'$each': list(user_ids)}}, '$set': {'updated_at': now}},
+                    upsert=True
+                )
+                for channel_id, user_ids in by_channel.items()
+            ]
+            await self.rqst_fsub_Channel_data.bulk_write(ops, ordered=False)
+
+    async def queue_req_user(self, channel_id: int, user_id: int):
+        """Store a join request as part of a short batch shared with concurrent callers.
+
+        Returns once the batch holding this request has been written.
+        """
+        self._req_queue.append((int(channel_id), int(user_id)))
+        if self._req_flush is None:
+            self._req_flush = asyncio.get_running_loop().create_future()
+            asyncio.create_task(self._flush_req_queue(self._req_flush))
+        return await asyncio.shield(self._req_flush)
+
+    async def _flush_req_queue(self, done):
+        await asyncio.sleep(0.2)  # let a burst of join requests pile up
+        pairs, self._req_queue = self._req_queue, []
+        self._req_flush = None
+        try:
+            await self.req_users_bulk(pairs)
+            done.set_result(True)
+        except Exception as e:
+            logging.error(f"[DB ERROR] Failed to store {len(pairs)} join requests: {e}")
+            done.set_result(False)
+
     async def del_req_user(self, channel_id: int, user_id: int):
-        await self.rqst_fsub_Channel_data.update_one(
-            {'_id': channel_id},
-            {'$pull': {'user_ids': user_id}}
-        )
+        if self.req_storage == "docs":
+            await self.rqst_fsub_user_data.delete_one({'channel_id': channel_id, 'user_id': user_id})
+        else:
+            await self.rqst_fsub_Channel_data.update_one(
+                {'_id': channel_id},
+                {'$pull': {'user_ids': user_id}, '$set': {'updated_at': datetime.utcnow()}}
+            )
 
     async def req_user_exist(self, channel_id: int, user_id: int):
         try:
-            found = await self.rqst_fsub_Channel_data.find_one({
-                '_id': int(channel_id),
-                'user_ids': int(user_id)
-            })
+            if self.req_storage == "docs":
+                found = await self.rqst_fsub_user_data.find_one(
+                    {'channel_id': int(channel_id), 'user_id': int(user_id)},
+                    {'_id': 1}
+                )
+            else:
+                found = await self.rqst_fsub_Channel_data.find_one({
+                    '_id': int(channel_id),
+                    'user_ids': int(user_id)
+                }, {'_id': 1})
             return bool(found)
         except Exception as e:
             logging.error(f"[DB ERROR] Failed to check request list: {e}")
             return False
 
+    async def get_req_users(self, channel_id: int):
+        if self.req_storage == "docs":
+            cursor = self.rqst_fsub_user_data.find({'channel_id': channel_id}, {'user_id': 1, '_id': 0})
+            return [doc['user_id'] async for doc in cursor]
+        data = await self.rqst_fsub_Channel_data.find_one({'_id': channel_id})
+        return data.get('user_ids', []) if data else []
+
+    async def get_req_users_page(self, channel_id: int, after: int | None, limit: int):
+        """Return up to `limit` requesting user ids greater than `after`, in ascending order."""
+        if self.req_storage == "docs":
+            query = {'channel_id': channel_id}
+            if after is not None:
+                query['user_id'] = {'$gt': after}
+            cursor = self.rqst_fsub_user_data.find(query, {'user_id': 1, '_id': 0}).sort('user_id', ASCENDING).limit(limit)
+            return [doc['user_id'] async for doc in cursor]
+        # Filter, sort and limit server-side so each page ships `limit` ids,
+        # not the whole array; $unwind works on every MongoDB version
+        pipeline = [{'$match': {'_id': channel_id}}, {'$unwind': '$user_ids'}]
+        if after is not None:
+            pipeline.append({'$match': {'user_ids': {'$gt': after}}})
+        pipeline += [{'$sort': {'user_ids': 1}}, {'$limit': limit}, {'$project': {'_id': 0, 'user_ids': 1}}]
+        cursor = self.rqst_fsub_Channel_data.aggregate(pipeline)
+        return [doc['user_ids'] async for doc in cursor]
+
+    async def del_req_users_bulk(self, channel_id: int, user_ids):
+        if not user_ids:
+            return
+        if self.req_storage == "docs":
+            await self.rqst_fsub_user_data.delete_many({'channel_id': channel_id, 'user_id': {'$in': list(user_ids)}})
+        else:
+            await self.rqst_fsub_Channel_data.update_one(
+                {'_id': channel_id},
+                {'$pull': {'user_ids': {'$in': list(user_ids)}}, '$set': {'updated_at': datetime.utcnow()}}
+            )
+
+    # /DELREQ JOBS
+    async def get_delreq_job(self, channel_id: int):
+        return await self.delreq_job_data.find_one({'_id': channel_id})
+
+    async def get_running_delreq_jobs(self):
+        return await self.delreq_job_data.find({'status': 'running'}).to_list(length=None)
+
+    async def save_delreq_job(self, channel_id: int, **fields):
+        await self.delreq_job_data.update_one({'_id': channel_id}, {'$set': fields}, upsert=True)
+
+    # BATCH MANIFESTS
+    async def create_batch_manifest(self, message_ids, created_by: int | None = None):
+        """Store an ordered list of DB channel message ids under a new short code and return the code."""
+        while True:
+            code = base64.urlsafe_b64encode(os.urandom(6)).decode('ascii')
+            try:
+                await self.batch_manifest_data.insert_one({
+                    '_id': code, 'message_ids': list(message_ids),
+                    'created_by': created_by, 'created_at': datetime.utcnow(),
+                })
+                return code
+            except DuplicateKeyError:
+                continue
+
+    async def get_batch_manifest(self, code: str):
+        doc = await self.batch_manifest_data.find_one({'_id': code}, {'message_ids': 1})
+        return doc['message_ids'] if doc else None
+
+    # BACKUP WATERMARKS
+    async def get_backup_state(self):
+        """Return {collection name: state} for incremental backups; '_base' holds the last full run."""
+        return {doc['_id']: doc async for doc in self.backup_state_data.find({})}
+
+    async def save_backup_state(self, name: str, **fields):
+        await self.backup_state_data.update_one({'_id': name}, {'$set': fields}, upsert=True)
+
+    # WORKER JOB QUEUE
+    async def enqueue_job(self, kind: str, key: str | None = None, **payload):
+        """Queue a job for the worker process; a job with the same key still pending or running is reused."""
+        doc = {
+            'kind': kind, 'key': key, 'payload': payload, 'status': 'queued',
+            'attempts': 0, 'worker': None, 'lease_until': None, 'progress': {},
+            'error': None, 'created_at': datetime.utcnow(),
+        }
+        if key is None:
+            result = await self.job_data.insert_one(doc)
+            return result.inserted_id
+        doc.pop('key')
+        result = await self.job_data.find_one_and_update(
+            {'key': key, 'status': {'$in': ['queued', 'running']}},
+            {'$setOnInsert': doc},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return result['_id']
+
+    async def claim_job(self, worker_id: str, lease_seconds: int, max_attempts: int):
+        """Lease the oldest queued job, or a running one whose worker stopped renewing its lease."""
+        now = datetime.utcnow()
+        # A worker that died on the last attempt leaves its job running with nothing
+        # left to retry; fail it so it stops holding its key against new enqueues
+        await self.job_data.update_many(
+            {'status': 'running', 'lease_until': {'$lt': now}, 'attempts': {'$gte': max_attempts}},
+            {'$set': {'status': 'failed', 'error': 'lease expired on the last attempt',
+                      'worker': None, 'lease_until': None}}
+        )
+        return await self.job_data.find_one_and_update(
+            {
+                'attempts': {'$lt': max_attempts},
+                '$or': [
+                    {'status': 'queued'},
+                    {'status': 'running', 'lease_until': {'$lt': now}},
+                ],
+            },
+            {
+                '$set': {
+                    'status': 'running', 'worker': worker_id,
+                    'lease_until': now + timedelta(seconds=lease_seconds), 'started_at': now,
+                },
+                '$inc': {'attempts': 1},
+            },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renew_job_lease(self, job_id, worker_id: str, lease_seconds: int):
+        result = await self.job_data.update_one(
+            {'_id': job_id, 'worker': worker_id, 'status': 'running'},
+            {'$set': {'lease_until': datetime.utcnow() + timedelta(seconds=lease_seconds)}}
+        )
+        return result.modified_count == 1
+
+    async def update_job_progress(self, job_id, **progress):
+        await self.job_data.update_one(
+            {'_id': job_id},
+            {'$set': {f'progress.{k}': v for k, v in progress.items()}}
+        )
+
+    async def finish_job(self, job_id, worker_id: str):
+        # Only the worker holding the lease may close the job
+        await self.job_data.update_one(
+            {'_id': job_id, 'worker': worker_id, 'status': 'running'},
+            {'$set': {'status': 'done', 'lease_until': None, 'finished_at': datetime.utcnow()}}
+        )
+
+    async def fail_job(self, job_id, worker_id: str, error: str, max_attempts: int):
+        """Put a job back in the queue, or mark it failed once it has used every attempt."""
+        owned = {'_id': job_id, 'worker': worker_id, 'status': 'running'}
+        job = await self.job_data.find_one(owned, {'attempts': 1})
+        if not job:
+            return
+        status = 'queued' if job['attempts'] < max_attempts else 'failed'
+        await self.job_data.update_one(
+            owned,
+            {'$set': {'status': status, 'error': error, 'worker': None, 'lease_until': None}}
+        )
+
+    async def migrate_req_users(self, batch_size: int = 1000):
+        """Move user_ids arrays from request_forcesub_channel into per-user documents."""
+        moved = 0
+        async for doc in self.rqst_fsub_Channel_data.find({'user_ids.0': {'$exists': True}}):
+            channel_id = doc['_id']
+            user_ids = doc['user_ids']
+            for i in range(0, len(user_ids), batch_size):
+                now = datetime.utcnow()
+                ops = [
+                    UpdateOne(
+                        {'channel_id': channel_id, 'user_id': user_id},
+                        {'$setOnInsert': {'created_at': now}},
+                        upsert=True
+                    )
+                    for user_id in user_ids[i:i + batch_size]
+                ]
+                await self._upsert_bulk(self.rqst_fsub_user_data, ops)
+            # Only drop the array once every user in it is stored as a document
+            await self.rqst_fsub_Channel_data.update_one(
+                {'_id': channel_id}, {'$unset': {'user_ids': ''}, '$set': {'updated_at': datetime.utcnow()}}
+            )
+            moved += len(user_ids)
+        if moved:
+            logging.info(f"[DB] Migrated {moved} join requests to per-user documents")
+        return moved
+
+    # SCHEDULED DELETIONS
+    async def schedule_deletions(self, entries):
+        """Queue {'chat_id', 'message_id', 'delete_at'} documents for the deletion reaper."""
+        if entries:
+            await self.delete_queue_data.insert_many(entries, ordered=False)
+
+    async def get_due_deletions(self, now: datetime, limit: int):
+        # Plain entries (no action) sort before the 'notify' entry due with them,
+        # so a batch never holds a notice without the files it announces
+        cursor = self.delete_queue_data.find({'delete_at': {'$lte': now}}).sort(
+            [('delete_at', ASCENDING), ('action', ASCENDING)]
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def postpone_deletions(self, entry_ids, delete_at: datetime):
+        if entry_ids:
+            await self.delete_queue_data.update_many(
+                {'_id': {'$in': list(entry_ids)}}, {'$set': {'delete_at': delete_at}}
+            )
+
+    async def remove_deletions(self, entry_ids):
+        if entry_ids:
+            await self.delete_queue_data.delete_many({'_id': {'$in': list(entry_ids)}})
+
+    # INDEXES
+    async def ensure_indexes(self):
+        await self.delete_queue_data.create_index([('delete_at', ASCENDING), ('action', ASCENDING)])
+        await self.job_data.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+        await self.job_data.create_index('key')
+        await self.user_data.create_index('joined')
+        await self.rqst_fsub_user_data.create_index([('created_at', ASCENDING), ('_id', ASCENDING)])
+        await self.rqst_fsub_Channel_data.create_index('updated_at')
+        await self.batch_manifest_data.create_index('created_at')
+        await self.rqst_fsub_user_data.create_index(
+            [('channel_id', ASCENDING), ('user_id', ASCENDING)], unique=True
+        )
+        if REQ_USER_TTL > 0:
+            try:
+                await self.rqst_fsub_user_data.create_index('created_at', expireAfterSeconds=REQ_USER_TTL)
+            except OperationFailure:
+                # TTL changed since the index was built; update it in place
+                await self.database.command(
+                    'collMod', 'request_forcesub_user',
+                    index={'keyPattern': {'created_at': 1}, 'expireAfterSeconds': REQ_USER_TTL}
+                )
+        else:
+            try:
+                await self.rqst_fsub_user_data.drop_index('created_at_1')
+            except OperationFailure:
+                pass
+
     async def reqChannel_exist(self, channel_id: int):
         return channel_id in await self.show_channels()
 
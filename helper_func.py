@@ -2,110 +2,681 @@
 #neel_leen on Tg
 
 import base64
+import functools
+import gzip
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import os
 import re
+import zipfile
 import asyncio
 import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
 from pyrogram import filters
 from pyrogram.enums import ChatMemberStatus
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import *
 from pyrogram.errors.exceptions.bad_request_400 import UserNotParticipant
 from pyrogram.errors import FloodWait
 from database.database import *
+import bson
+from bson import json_util
+from bson.json_util import dumps as bson_dumps
+from pymongo import ReplaceOne
 
 
 
 #used for cheking if a user is admin ~Owner also treated as admin level
 async def check_admin(filter, client, update):
     try:
-        user_id = update.from_user.id       
-        return any([user_id == OWNER_ID, await db.admin_exist(user_id)])
+        user_id = update.from_user.id
+        return user_id == OWNER_ID or db.is_admin(user_id)
     except Exception as e:
         print(f"! Exception in check_admin: {e}")
         return False
 
-async def is_subscribed(client, user_id):
-    channel_ids = await db.show_channels()
+class ChannelRegistry:
+    """Force-sub channel ids, modes and chat titles/usernames held in memory.
 
-    if not channel_ids:
-        return True
+    Reloaded from Mongo and Telegram every FSUB_REGISTRY_TTL seconds and
+    right after /addchnl, /delchnl or a mode toggle.
+    """
 
-    if user_id == OWNER_ID:
-        return True
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.channels = {}  # chat_id -> {'mode', 'title', 'username', 'invite_link'}
+        self._client = None
+        self._lock = asyncio.Lock()
+        self._task = None
 
-    for cid in channel_ids:
-        if not await is_sub(client, user_id, cid):
-            # Retry once if join request might be processing
-            mode = await db.get_channel_mode(cid)
-            if mode == "on":
-                await asyncio.sleep(2)  # give time for @on_chat_join_request to process
-                if await is_sub(client, user_id, cid):
-                    continue
-            return False
+    def __contains__(self, chat_id):
+        return chat_id in self.channels
+
+    def ids(self):
+        return list(self.channels)
+
+    def mode(self, chat_id):
+        info = self.channels.get(chat_id)
+        return info['mode'] if info else "off"
+
+    def get(self, chat_id):
+        return self.channels.get(chat_id)
+
+    def set_mode(self, chat_id, mode):
+        if chat_id in self.channels:
+            self.channels[chat_id]['mode'] = mode
+
+    async def _chat_info(self, chat_id, previous):
+        try:
+            chat = await self._client.get_chat(chat_id)
+            return {'title': chat.title, 'username': chat.username, 'invite_link': chat.invite_link}
+        except Exception as e:
+            print(f"[!] Could not fetch force-sub chat {chat_id}: {e}")
+            return previous
+
+    async def refresh(self):
+        async with self._lock:
+            modes = await db.get_fsub_channels()
+            infos = {}
+            if self._client is not None:
+                results = await asyncio.gather(
+                    *(self._chat_info(cid, self.channels.get(cid, {})) for cid in modes)
+                )
+                infos = dict(zip(modes, results))
+            channels = {}
+            for cid, mode in modes.items():
+                info = infos.get(cid) or self.channels.get(cid, {})
+                channels[cid] = {
+                    'mode': mode,
+                    'title': info.get('title'),
+                    'username': info.get('username'),
+                    'invite_link': info.get('invite_link'),
+                }
+            self.channels = channels
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"[!] Channel registry refresh failed: {e}")
+            await asyncio.sleep(self.ttl)
+
+    def start(self, client):
+        self._client = client
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+
+channel_registry = ChannelRegistry(FSUB_REGISTRY_TTL)
+
+
+async def _in_channel_registry(_, __, update):
+    chat = getattr(update, 'chat', None)
+    return chat is not None and chat.id in channel_registry
+
+
+# (user_id, channel_id) -> (is_member, expires_at); shared by is_subscribed and not_joined
+membership_cache = {}
+
+
+def invalidate_membership(user_id, channel_id):
+    membership_cache.pop((user_id, channel_id), None)
+
+
+def _cache_membership(user_id, channel_id, is_member):
+    now = time.monotonic()
+    if len(membership_cache) > 50000:
+        for key in [k for k, (_, exp) in membership_cache.items() if exp <= now]:
+            del membership_cache[key]
+    ttl = FSUB_CACHE_TTL if is_member else FSUB_NEG_CACHE_TTL
+    membership_cache[(user_id, channel_id)] = (is_member, now + ttl)
+
+
+async def get_unjoined_channels(client, user_id):
+    """Return the force-sub channels the user is missing, checking all of them concurrently."""
+    channel_ids = channel_registry.ids()
+
+    if not channel_ids or user_id == OWNER_ID:
+        return []
+
+    results = await asyncio.gather(*(is_sub(client, user_id, cid) for cid in channel_ids))
+    return [cid for cid, joined in zip(channel_ids, results) if not joined]
+
+
+# (channel_id, user_id) -> (future, created_at) for users we sent a join-request link to
+join_waiters = {}
+# A user who has not sent the request a few minutes after seeing the link
+# probably will not; stop making their retries wait for it
+JOIN_WAITER_TTL = 300
+
+
+def expect_join_request(channel_id, user_id):
+    now = time.monotonic()
+    if len(join_waiters) > 10000:
+        for key in [k for k, (_, created) in join_waiters.items() if now - created > JOIN_WAITER_TTL]:
+            del join_waiters[key]
+    entry = join_waiters.get((channel_id, user_id))
+    if entry is None or entry[0].done():
+        join_waiters[(channel_id, user_id)] = (asyncio.get_running_loop().create_future(), now)
+
+
+def resolve_join_request(channel_id, user_id):
+    entry = join_waiters.pop((channel_id, user_id), None)
+    if entry and not entry[0].done():
+        entry[0].set_result(True)
+
+
+async def wait_for_join_request(channel_id, user_id, timeout):
+    """Wait until handle_join_request sees this user's request; False at once if none is pending.
+
+    A waiter older than JOIN_WAITER_TTL, or one that already timed out once,
+    is dropped so later retries do not wait again.
+    """
+    key = (channel_id, user_id)
+    entry = join_waiters.get(key)
+    if entry is None:
+        return False
+    if time.monotonic() - entry[1] > JOIN_WAITER_TTL:
+        join_waiters.pop(key, None)
+        return False
+    try:
+        return await asyncio.wait_for(asyncio.shield(entry[0]), timeout)
+    except asyncio.TimeoutError:
+        if join_waiters.get(key) is entry:
+            del join_waiters[key]
+        return False
+
+
+async def _recheck_join_request(client, user_id, channel_id):
+    # The user may have just tapped our join-request link; give the update a moment to land
+    if not await wait_for_join_request(channel_id, user_id, FSUB_JOIN_WAIT):
+        return False
+    return await is_sub(client, user_id, channel_id)
+
+
+class InviteLinkPool:
+    """Invite links created ahead of time per (channel, join-request mode).
+
+    The force-sub prompt only reads from memory; a background loop fills one
+    pool per channel in channel_registry at start, then tops the pools up and
+    rotates links out before FSUB_LINK_EXPIRY runs out.
+    """
+
+    def __init__(self, size, expiry):
+        self.size = max(1, size)
+        self.expiry = expiry
+        self._links = {}  # (chat_id, join_request) -> [(invite_link, expires_at or None)]
+        self._turn = {}
+        self._filling = set()
+        self._pending = {}  # key -> task creating the first link of an empty pool
+        self._task = None
+
+    def _fresh(self, key):
+        now = time.time()
+        # Retire a link once less than a fifth of its lifetime is left
+        margin = self.expiry * 0.2
+        links = [
+            (link, expires) for link, expires in self._links.get(key, [])
+            if expires is None or expires - margin > now
+        ]
+        self._links[key] = links
+        return links
+
+    async def _create(self, client, chat_id, join_request):
+        invite = await client.create_chat_invite_link(
+            chat_id=chat_id,
+            creates_join_request=join_request,
+            expire_date=datetime.utcnow() + timedelta(seconds=self.expiry) if self.expiry else None
+        )
+        expires = time.time() + self.expiry if self.expiry else None
+        self._links.setdefault((chat_id, join_request), []).append((invite.invite_link, expires))
+        return invite.invite_link
+
+    async def get(self, client, chat_id, join_request):
+        key = (chat_id, join_request)
+        links = self._fresh(key)
+        if not links:
+            # Empty pool (channel added since the last refill): every prompt
+            # arriving now waits on the same link instead of creating its own
+            task = self._pending.get(key)
+            if task is None:
+                task = asyncio.create_task(self._create(client, chat_id, join_request))
+                task.add_done_callback(lambda _: self._pending.pop(key, None))
+                self._pending[key] = task
+                asyncio.create_task(self._top_up(client, key))
+            return await asyncio.shield(task)
+        turn = self._turn.get(key, 0) % len(links)
+        self._turn[key] = turn + 1
+        return links[turn][0]
+
+    async def _top_up(self, client, key):
+        if key in self._filling:
+            return
+        self._filling.add(key)
+        try:
+            while len(self._fresh(key)) < self.size:
+                await self._create(client, *key)
+        except FloodWait as e:
+            await asyncio.sleep(get_flood_wait_seconds(e))
+        except Exception as e:
+            print(f"[!] Invite link refill failed for {key[0]}: {e}")
+        finally:
+            self._filling.discard(key)
 
-    return True
+    async def refill(self, client):
+        wanted = {(cid, channel_registry.mode(cid) == "on") for cid in channel_registry.ids()}
+        for key in list(self._links):
+            if key not in wanted:
+                self._links.pop(key, None)
+                self._turn.pop(key, None)
+        for key in wanted:
+            await self._top_up(client, key)
+
+    async def _run(self, client):
+        interval = max(30, self.expiry * 0.1) if self.expiry else 300
+        while True:
+            try:
+                await self.refill(client)
+            except Exception as e:
+                print(f"[!] Invite link pool error: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, client):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(client))
+
+
+invite_links = InviteLinkPool(FSUB_LINK_POOL_SIZE, FSUB_LINK_EXPIRY)
+
+
+async def is_subscribed(client, user_id):
+    missing = await get_unjoined_channels(client, user_id)
+    if not missing:
+        return True
+
+    results = await asyncio.gather(*(_recheck_join_request(client, user_id, cid) for cid in missing))
+    return all(results)
 
 
 async def is_sub(client, user_id, channel_id):
+    cached = membership_cache.get((user_id, channel_id))
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
     try:
         member = await client.get_chat_member(channel_id, user_id)
         status = member.status
         #print(f"[SUB] User {user_id} in {channel_id} with status {status}")
-        return status in {
+        joined = status in {
             ChatMemberStatus.OWNER,
             ChatMemberStatus.ADMINISTRATOR,
             ChatMemberStatus.MEMBER
         }
 
     except UserNotParticipant:
-        mode = await db.get_channel_mode(channel_id)
+        mode = channel_registry.mode(channel_id)
         if mode == "on":
-            exists = await db.req_user_exist(channel_id, user_id)
-            #print(f"[REQ] User {user_id} join request for {channel_id}: {exists}")
-            return exists
-        #print(f"[NOT SUB] User {user_id} not in {channel_id} and mode != on")
-        return False
+            joined = await db.req_user_exist(channel_id, user_id)
+            #print(f"[REQ] User {user_id} join request for {channel_id}: {joined}")
+        else:
+            #print(f"[NOT SUB] User {user_id} not in {channel_id} and mode != on")
+            joined = False
 
     except Exception as e:
         print(f"[!] Error in is_sub(): {e}")
         return False
 
+    _cache_membership(user_id, channel_id, joined)
+    return joined
 
-async def encode(string):
-    string_bytes = string.encode("ascii")
-    base64_bytes = base64.urlsafe_b64encode(string_bytes)
-    base64_string = (base64_bytes.decode("ascii")).strip("=")
-    return base64_string
 
-async def decode(base64_string):
-    base64_string = base64_string.strip("=") # links generated before this commit will be having = sign, hence striping them to handle padding errors.
-    base64_bytes = (base64_string + "=" * (-len(base64_string) % 4)).encode("ascii")
-    string_bytes = base64.urlsafe_b64decode(base64_bytes) 
-    string = string_bytes.decode("ascii")
-    return string
+# Signed binary /start payloads: one header byte (version << 4 | kind), varint
+# ids, then a truncated HMAC-SHA256 of everything before it
+LINK_VERSION = 1
+LINK_SINGLE, LINK_RANGE, LINK_LIST, LINK_MANIFEST = 0, 1, 2, 3
+LINK_TAG_SIZE = 6
+LINK_KEY = hashlib.sha256(b"link:" + (LINK_SECRET or TG_BOT_TOKEN).encode()).digest()
 
-async def get_messages(client, message_ids):
-    messages = []
-    total_messages = 0
-    while total_messages != len(message_ids):
-        temb_ids = message_ids[total_messages:total_messages+200]
+
+def _put_varint(value, out):
+    if value < 0:
+        raise ValueError("varint value must not be negative")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _get_varint(data, pos):
+    value = shift = 0
+    while True:
+        if pos >= len(data) or shift > 63:
+            raise ValueError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _sign_link(kind, body):
+    data = bytes([LINK_VERSION << 4 | kind]) + bytes(body)
+    tag = hmac.new(LINK_KEY, data, hashlib.sha256).digest()[:LINK_TAG_SIZE]
+    return base64.urlsafe_b64encode(data + tag).decode("ascii").rstrip("=")
+
+
+def encode_ids(message_ids):
+    """Signed /start payload for one DB channel message id, or an ordered list of them."""
+    if not message_ids:
+        raise ValueError("no message ids to encode")
+    if min(message_ids) < 0:
+        raise ValueError("message ids must not be negative")
+    body = bytearray()
+    if len(message_ids) == 1:
+        _put_varint(message_ids[0], body)
+        return _sign_link(LINK_SINGLE, body)
+    _put_varint(len(message_ids), body)
+    _put_varint(message_ids[0], body)
+    for prev, cur in zip(message_ids, message_ids[1:]):
+        _put_varint(_zigzag(cur - prev), body)
+    return _sign_link(LINK_LIST, body)
+
+
+def encode_range(first, last):
+    """Signed /start payload for every DB channel message from first to last (either direction)."""
+    if first < 0 or last < 0:
+        raise ValueError("message ids must not be negative")
+    body = bytearray()
+    _put_varint(first, body)
+    _put_varint(_zigzag(last - first), body)
+    return _sign_link(LINK_RANGE, body)
+
+
+def encode_manifest(code):
+    """Signed /start payload pointing at a stored batch manifest."""
+    return _sign_link(LINK_MANIFEST, base64.urlsafe_b64decode(code))
+
+
+def _parse_signed(raw):
+    if len(raw) <= 1 + LINK_TAG_SIZE or raw[0] >> 4 != LINK_VERSION:
+        return None
+    data, tag = raw[:-LINK_TAG_SIZE], raw[-LINK_TAG_SIZE:]
+    if not hmac.compare_digest(tag, hmac.new(LINK_KEY, data, hashlib.sha256).digest()[:LINK_TAG_SIZE]):
+        return None
+
+    kind = data[0] & 0x0F
+    if kind == LINK_MANIFEST:
+        return base64.urlsafe_b64encode(data[1:]).decode("ascii")
+    first, pos = _get_varint(data, 1)
+    if kind == LINK_SINGLE:
+        ids = (first,)
+    elif kind == LINK_RANGE:
+        delta, pos = _get_varint(data, pos)
+        last = first + _unzigzag(delta)
+        ids = range(first, last + 1) if first <= last else range(first, last - 1, -1)
+    elif kind == LINK_LIST:
+        count, ids = first, []
+        first, pos = _get_varint(data, pos)
+        ids.append(first)
+        while len(ids) < count:
+            delta, pos = _get_varint(data, pos)
+            ids.append(ids[-1] + _unzigzag(delta))
+        ids = tuple(ids)
+    else:
+        return None
+    return ids if pos == len(data) else None
+
+
+def _parse_legacy(string, channel_id):
+    argument = string.split("-")
+    divisor = abs(channel_id)
+    if argument[0] == "get" and len(argument) == 2:
+        return (int(int(argument[1]) / divisor),)
+    if argument[0] == "batch":
+        return tuple(int(int(a) / divisor) for a in argument[1:])
+    if argument[0] == "get" and len(argument) == 3:
+        start = int(int(argument[1]) / divisor)
+        end = int(int(argument[2]) / divisor)
+        return range(start, end + 1) if start <= end else range(start, end - 1, -1)
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_link(payload, channel_id):
+    """Return the message ids (tuple or range) a /start payload points to, or None if it is invalid or forged.
+
+    Batch manifest links return the manifest code (a str) instead; see resolve_manifest.
+
+    Signed payloads are checked before anything else; old unsigned
+    get-/batch- payloads are accepted while LEGACY_LINKS is on. Results,
+    including rejections, are cached so hot links parse once.
+    """
+    try:
+        padded = payload.strip("=")
+        raw = base64.urlsafe_b64decode(padded + "=" * (-len(padded) % 4))
+        if raw and raw[0] < 0x20:
+            return _parse_signed(raw)
+        if LEGACY_LINKS:
+            return _parse_legacy(raw.decode("ascii"), channel_id)
+    except (ValueError, UnicodeDecodeError):
+        pass
+    return None
+
+
+# Manifests never change once written, so resolved ones are simply kept (LRU)
+manifest_cache = OrderedDict()
+MANIFEST_CACHE_SIZE = 10000
+
+
+async def resolve_manifest(code):
+    """Return the ordered message ids of a batch manifest, or None if no such manifest exists."""
+    ids = manifest_cache.get(code)
+    if ids is not None:
+        manifest_cache.move_to_end(code)
+        return ids
+    ids = await db.get_batch_manifest(code)
+    if ids is None:
+        return None
+    ids = tuple(ids)
+    manifest_cache[code] = ids
+    if len(manifest_cache) > MANIFEST_CACHE_SIZE:
+        manifest_cache.popitem(last=False)
+    return ids
+
+
+class MessageCache:
+    """LRU of DB channel messages keyed by (chat_id, message_id), bounded by an estimated size in bytes.
+
+    Stored posts rarely change, so popular links are served without calling
+    get_messages. Edits made by the bot invalidate the affected entries.
+    """
+
+    BASE_SIZE = 2048  # rough footprint of a Message object without its text
+
+    def __init__(self, max_bytes, ttl=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.entries = OrderedDict()  # (chat_id, message_id) -> (message, size, stored_at)
+
+    @classmethod
+    def _estimate(cls, msg):
+        text = msg.text or msg.caption or ""
+        return cls.BASE_SIZE + len(str(text))
+
+    def get(self, chat_id, message_id):
+        key = (chat_id, message_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        msg, _, stored_at = entry
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            self.invalidate(chat_id, message_id)
+            return None
+        self.entries.move_to_end(key)
+        return msg
+
+    def put(self, chat_id, msg):
+        if self.max_bytes <= 0 or not msg or msg.empty:
+            return
+        self.invalidate(chat_id, msg.id)
+        size = self._estimate(msg)
+        self.entries[(chat_id, msg.id)] = (msg, size, time.monotonic())
+        self.size += size
+        while self.size > self.max_bytes and self.entries:
+            _, (_, old_size, _) = self.entries.popitem(last=False)
+            self.size -= old_size
+
+    def invalidate(self, chat_id, message_id):
+        entry = self.entries.pop((chat_id, message_id), None)
+        if entry:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+message_cache = MessageCache(MESSAGE_CACHE_BYTES, MESSAGE_CACHE_TTL)
+
+
+# (chat_id, message_id) -> future of the fetch currently loading that message
+message_fetches = {}
+# Result handed to waiters when the request that owned the fetch was cancelled
+_FETCH_ABANDONED = object()
+
+
+async def _fetch_message_chunk(client, chat_id, message_ids):
+    """Load up to 200 messages in one RPC and hand each result to whoever is waiting on it."""
+    msgs = []
+    try:
         try:
             msgs = await client.get_messages(
-                chat_id=client.db_channel.id,
-                message_ids=temb_ids
+                chat_id=chat_id,
+                message_ids=message_ids
             )
         except FloodWait as e:
-            # e may have different attribute names depending on pyrogram version
-            wait = int(getattr(e, 'value', getattr(e, 'x', getattr(e, 'wait', 1))))
-            await asyncio.sleep(wait)
+            await asyncio.sleep(get_flood_wait_seconds(e))
             msgs = await client.get_messages(
-                chat_id=client.db_channel.id,
-                message_ids=temb_ids
+                chat_id=chat_id,
+                message_ids=message_ids
             )
-        except:
-            pass
-        total_messages += len(temb_ids)
-        messages.extend(msgs)
-    return messages
+    except Exception as e:
+        print(f"Error fetching messages {message_ids[0]}-{message_ids[-1]}: {e}")
+    # A cancelled fetch skips this; get_messages marks its ids abandoned instead
+    by_id = {msg.id: msg for msg in msgs if msg}
+    for msg_id in message_ids:
+        msg = by_id.get(msg_id)
+        message_cache.put(chat_id, msg)
+        future = message_fetches.pop((chat_id, msg_id), None)
+        if future and not future.done():
+            future.set_result(msg)
+
+
+async def get_messages(client, message_ids):
+    """Return the DB channel messages for message_ids, in order.
+
+    Ids are served from message_cache first. Ids already being fetched by
+    another request are awaited instead of fetched again, so a burst of
+    identical /start links costs one get_messages call per chunk.
+    """
+    chat_id = client.db_channel.id
+    loop = asyncio.get_running_loop()
+    found = {}
+    waiting = {}
+    own = []
+    for msg_id in message_ids:
+        if msg_id in found or msg_id in waiting:
+            continue
+        msg = message_cache.get(chat_id, msg_id)
+        if msg:
+            found[msg_id] = msg
+            continue
+        future = message_fetches.get((chat_id, msg_id))
+        if future is None:
+            future = loop.create_future()
+            message_fetches[(chat_id, msg_id)] = future
+            own.append(msg_id)
+        waiting[msg_id] = future
+
+    try:
+        for i in range(0, len(own), 200):
+            await _fetch_message_chunk(client, chat_id, own[i:i + 200])
+    finally:
+        # Never leave other waiters hanging if this request is cancelled midway;
+        # they fetch the abandoned ids themselves rather than drop them
+        for msg_id in own:
+            future = message_fetches.pop((chat_id, msg_id), None)
+            if future and not future.done():
+                future.set_result(_FETCH_ABANDONED)
+
+    abandoned = []
+    for msg_id, future in waiting.items():
+        # Shielded so a cancelled request does not cancel the fetch others share
+        msg = await asyncio.shield(future)
+        if msg is _FETCH_ABANDONED:
+            abandoned.append(msg_id)
+        elif msg is not None:
+            found[msg_id] = msg
+    if abandoned:
+        for msg in await get_messages(client, abandoned):
+            found[msg.id] = msg
+    return [found[msg_id] for msg_id in message_ids if msg_id in found]
+
+async def iter_messages(client, message_ids, chunk_size=100, buffer=2):
+    """Yield DB channel messages in order, fetching the next chunk while the caller works on this one.
+
+    message_ids may be a lazy range; at most `buffer` fetched chunks are held
+    in memory at a time, whatever the size of the link.
+    """
+    queue = asyncio.Queue(maxsize=buffer)
+
+    async def produce():
+        try:
+            chunk = []
+            for msg_id in message_ids:
+                chunk.append(msg_id)
+                if len(chunk) == chunk_size:
+                    await queue.put(await get_messages(client, chunk))
+                    chunk = []
+            if chunk:
+                await queue.put(await get_messages(client, chunk))
+            await queue.put(None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            for msg in item:
+                yield msg
+    finally:
+        producer.cancel()
 
 async def get_message_id(client, message):
     if message.forward_from_chat:
@@ -165,10 +736,473 @@ def get_exp_time(seconds):
 
 subscribed = filters.create(is_subscribed)
 admin = filters.create(check_admin)
+# Chat member / join request updates from registered force-sub channels only
+fsub_channel = filters.create(_in_channel_registry)
 
 # Users currently in interactive ask flows (suppress search handler for these users)
 interactive_users = set()
 
+# Send gateway priority lanes, highest first
+INTERACTIVE, ADMIN, BULK = 0, 1, 2
+
+
+class SendGateway:
+    """The single outbound path for send/copy/edit/delete calls.
+
+    Calls wait in priority lanes (INTERACTIVE, then ADMIN, then BULK) and are
+    released against one global rate. ADMIN and BULK are also capped at their
+    own rates, which back off independently.
+
+    Each chat gets its own spacing: INTERACTIVE and ADMIN sends start at
+    `min_interval` apart, the gap doubles (up to `max_interval`) when that
+    chat hits a FloodWait and shrinks again after each success. BULK sends
+    keep a fixed `bulk_chat_interval`.
+
+    A FloodWait on a call with a chat_id is treated as that chat's limit.
+    Floods on chat-less calls, or floods hitting FLOOD_SPREAD different chats
+    within FLOOD_WINDOW seconds, are bot-wide: the lane that hit it halves its
+    rate (INTERACTIVE halves the shared one) and pauses itself and every lower
+    lane. Admin jobs and broadcasts therefore never slow /start deliveries.
+    """
+
+    FLOOD_WINDOW = 10
+    FLOOD_SPREAD = 3
+    STEP = 0.01
+
+    def __init__(self, rate, min_rate, min_interval, max_interval, bulk_rate, bulk_chat_interval):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.bulk_chat_interval = bulk_chat_interval
+        # Own caps for ADMIN and BULK; INTERACTIVE is only bound by `rate`
+        self.max_lane_rate = [rate, rate, bulk_rate]
+        self.lane_rate = [rate, rate, bulk_rate]
+        self.tokens = 1.0
+        self._floods = []  # (monotonic time, chat_id) of recent per-chat FloodWaits
+        self._updated = time.monotonic()
+        self._lane_next = [0.0, 0.0, 0.0]
+        self._chat_next = {}  # chat_id -> earliest monotonic time of its next send
+        self._chat_interval = {}  # chat_id -> spacing, only while above min_interval
+        self._blocked_until = [0.0, 0.0, 0.0]
+        self._lanes = [deque(), deque(), deque()]
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def cap(self, rate):
+        """Lower the ceiling for every lane, for a process sharing the bot's limits."""
+        self.max_rate = min(self.max_rate, rate)
+        self.rate = min(self.rate, rate)
+        self.max_lane_rate = [min(r, rate) for r in self.max_lane_rate]
+        self.lane_rate = [min(r, rate) for r in self.lane_rate]
+
+    def success(self, lane, chat_id=None):
+        if lane == INTERACTIVE:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+        else:
+            self.lane_rate[lane] = min(self.max_lane_rate[lane], self.lane_rate[lane] + 0.1)
+        interval = self._chat_interval.get(chat_id)
+        if interval is not None:
+            if interval - self.STEP <= self.min_interval:
+                del self._chat_interval[chat_id]
+            else:
+                self._chat_interval[chat_id] = interval - self.STEP
+
+    def flood(self, lane, seconds, chat_id=None):
+        now = time.monotonic()
+        until = now + seconds
+        if chat_id is not None:
+            interval = self._chat_interval.get(chat_id, self.min_interval)
+            self._chat_interval[chat_id] = min(self.max_interval, max(interval, self.STEP) * 2)
+            self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), until)
+            self._floods = [(t, c) for t, c in self._floods if now - t < self.FLOOD_WINDOW]
+            self._floods.append((now, chat_id))
+            if len({c for _, c in self._floods}) < self.FLOOD_SPREAD:
+                return
+
+        if lane == INTERACTIVE:
+            self.rate = max(self.min_rate, self.rate / 2)
+        else:
+            floor = min(self.min_rate, self.max_lane_rate[lane])
+            self.lane_rate[lane] = max(floor, self.lane_rate[lane] / 2)
+        for lower in range(lane, len(self._lanes)):
+            self._blocked_until[lower] = max(self._blocked_until[lower], until)
+
+    async def _chat_slot(self, lane, chat_id):
+        now = time.monotonic()
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+            self._chat_interval = {k: v for k, v in self._chat_interval.items() if k in self._chat_next}
+        if lane == BULK:
+            interval = self.bulk_chat_interval
+        else:
+            interval = self._chat_interval.get(chat_id, self.min_interval)
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _acquire(self, lane, chat_id):
+        if chat_id is not None:
+            await self._chat_slot(lane, chat_id)
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(future)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        await future
+
+    def _lane_opens_at(self, lane):
+        return max(self._blocked_until[lane], self._lane_next[lane])
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            lane = None
+            opens = []
+            for index, waiters in enumerate(self._lanes):
+                while waiters and waiters[0].done():
+                    waiters.popleft()  # caller was cancelled
+                if not waiters:
+                    continue
+                if now < self._lane_opens_at(index):
+                    opens.append(self._lane_opens_at(index))
+                    continue
+                lane = index
+                break
+
+            if lane is None:
+                # Sleep until a paused lane reopens or a new call arrives
+                self._wakeup.clear()
+                timeout = min(opens) - now if opens else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            self.tokens -= 1
+            if lane != INTERACTIVE:
+                self._lane_next[lane] = now + 1 / self.lane_rate[lane]
+            self._lanes[lane].popleft().set_result(None)
+
+    async def call(self, lane, chat_id, func, *args, retries=3, **kwargs):
+        """Run one Telegram call through the gateway, retrying after a FloodWait.
+
+        chat_id selects the per-chat spacing; pass None for calls that do not
+        send into a chat.
+        """
+        for attempt in range(retries):
+            await self._acquire(lane, chat_id)
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWait as e:
+                self.flood(lane, get_flood_wait_seconds(e), chat_id)
+                if attempt == retries - 1:
+                    raise
+                continue
+            self.success(lane, chat_id)
+            return result
+
+
+send_gateway = SendGateway(
+    SEND_RATE, SEND_MIN_RATE, DELIVERY_MIN_INTERVAL, DELIVERY_MAX_INTERVAL, BROADCAST_RATE, SEND_CHAT_INTERVAL
+)
+
+
+async def _delete_chunk(client, chat_id, message_ids):
+    """Returns the FloodWait seconds when the deletion has to be pushed back, else None."""
+    try:
+        # No retries here: a flooded chat is rescheduled instead of holding up the sweep
+        await send_gateway.call(ADMIN, chat_id, client.delete_messages, chat_id, message_ids, retries=1)
+    except FloodWait as e:
+        return get_flood_wait_seconds(e)
+    except Exception as e:
+        # Blocked bot, deleted account or message already gone: nothing left to do
+        print(f"[!] Scheduled deletion in {chat_id} failed: {e}")
+    return None
+
+
+AUTO_DELETE_DONE_TEXT = "<b>ʏᴏᴜʀ ᴠɪᴅᴇᴏ / ꜰɪʟᴇ ɪꜱ ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ !!\n\nᴄʟɪᴄᴋ ʙᴇʟᴏᴡ ʙᴜᴛᴛᴏɴ ᴛᴏ ɢᴇᴛ ʏᴏᴜʀ ᴅᴇʟᴇᴛᴇᴅ ᴠɪᴅᴇᴏ / ꜰɪʟᴇ 👇</b>"
+
+
+async def _notify_deleted(client, entry):
+    """Returns the FloodWait seconds when the edit has to be pushed back, else None."""
+    try:
+        reload_url = entry.get('reload_url')
+        keyboard = InlineKeyboardMarkup(
+            [[InlineKeyboardButton("ɢᴇᴛ ғɪʟᴇ ᴀɢᴀɪɴ!", url=reload_url)]]
+        ) if reload_url else None
+
+        await send_gateway.call(
+            ADMIN, entry['chat_id'], client.edit_message_text,
+            entry['chat_id'], entry['message_id'], AUTO_DELETE_DONE_TEXT, reply_markup=keyboard, retries=1
+        )
+    except FloodWait as e:
+        return get_flood_wait_seconds(e)
+    except Exception as e:
+        print(f"Error updating notification with 'Get File Again' button: {e}")
+    return None
+
+
+async def reap_due_deletions(client, limit=1000):
+    """Handle every queued entry that is due; returns how many entries were handled.
+
+    Plain entries are deleted, grouped per chat into delete_messages calls of
+    up to 100 ids, with up to DELETE_REAPER_CONCURRENCY calls in flight; the
+    send gateway keeps them within the rate limits. Entries with action
+    'notify' are the auto-delete notices, which get edited into the 'get file
+    again' message afterwards. A call that hits a FloodWait is not retried
+    here: its entries get a later delete_at, and so does the notice for the
+    same chat and delete_at, so one flooded chat never stalls the others.
+    """
+    due = await db.get_due_deletions(datetime.utcnow(), limit)
+    by_chat = {}
+    notices = []
+    for entry in due:
+        if entry.get('action') == 'notify':
+            notices.append(entry)
+        else:
+            by_chat.setdefault(entry['chat_id'], []).append(entry)
+    sem = asyncio.Semaphore(DELETE_REAPER_CONCURRENCY)
+    done = []
+    postponed = {}  # (chat_id, delete_at) -> new delete_at of its flooded entries
+
+    async def postpone(entries, seconds):
+        retry_at = datetime.utcnow() + timedelta(seconds=seconds)
+        for entry in entries:
+            key = (entry['chat_id'], entry['delete_at'])
+            postponed[key] = max(postponed.get(key, retry_at), retry_at)
+        await db.postpone_deletions([entry['_id'] for entry in entries], retry_at)
+
+    async def delete(chat_id, chunk):
+        async with sem:
+            wait = await _delete_chunk(client, chat_id, [entry['message_id'] for entry in chunk])
+        if wait is None:
+            done.extend(entry['_id'] for entry in chunk)
+        else:
+            await postpone(chunk, wait)
+
+    async def notify(entry):
+        retry_at = postponed.get((entry['chat_id'], entry['delete_at']))
+        if retry_at:
+            # Its files are not gone yet; keep the pair together
+            await db.postpone_deletions([entry['_id']], retry_at)
+            return
+        async with sem:
+            wait = await _notify_deleted(client, entry)
+        if wait is None:
+            done.append(entry['_id'])
+        else:
+            await postpone([entry], wait)
+
+    await asyncio.gather(*(
+        delete(chat_id, entries[i:i + 100])
+        for chat_id, entries in by_chat.items()
+        for i in range(0, len(entries), 100)
+    ))
+    await asyncio.gather(*(notify(entry) for entry in notices))
+    await db.remove_deletions(done)
+    return len(due)
+
+
+async def run_deletion_reaper(client):
+    # Entries that fell due while the bot was down are handled first
+    recovered = 0
+    while True:
+        try:
+            handled = await reap_due_deletions(client)
+        except Exception as e:
+            print(f"[!] Deletion reaper error: {e}")
+            break
+        if not handled:
+            break
+        recovered += handled
+    if recovered:
+        print(f"[+] Recovered {recovered} overdue scheduled deletions")
+
+    while True:
+        try:
+            # Keep going without a pause while a backlog is being worked off
+            if await reap_due_deletions(client):
+                continue
+        except Exception as e:
+            print(f"[!] Deletion reaper error: {e}")
+        await asyncio.sleep(DELETE_REAPER_INTERVAL)
+
+
+def backup_collections():
+    """Collections included in (and accepted by) JSON backups and /restore."""
+    return [
+        db.channel_data, db.admins_data, db.user_data, db.banned_user_data,
+        db.autho_user_data, db.del_timer_data, db.fsub_data, db.rqst_fsub_data,
+        db.rqst_fsub_Channel_data, db.rqst_fsub_user_data, db.batch_manifest_data,
+    ]
+
+
+class BackupWriter:
+    """Gzip-compressed NDJSON backup, split into volumes of at most volume_size bytes.
+
+    Each line is {"collection": name, "doc": <extended JSON>}. Documents are
+    buffered and serialized/compressed in a worker thread, so the event loop
+    only hands batches over. Every volume is a complete gzip stream and is
+    passed to on_volume(path) as soon as it is closed, which keeps at most
+    one volume on disk if the callback removes it.
+    """
+
+    def __init__(self, directory, prefix, volume_size, on_volume, batch_docs=5000):
+        self.directory = directory
+        self.prefix = prefix
+        self.volume_size = volume_size
+        self.on_volume = on_volume
+        self.batch_docs = batch_docs
+        self.count = 0
+        self._batch = []
+        self._raw = None
+        self._gzip = None
+        self._path = None
+        self._volume = 0
+
+    async def write(self, collection, doc):
+        self._batch.append((collection, doc))
+        self.count += 1
+        if len(self._batch) >= self.batch_docs:
+            await self._flush()
+
+    async def close(self):
+        await self._flush()
+        path = await asyncio.to_thread(self._close_volume)
+        if path:
+            await self.on_volume(path)
+
+    async def _flush(self):
+        batch, self._batch = self._batch, []
+        if batch:
+            for path in await asyncio.to_thread(self._encode, batch):
+                await self.on_volume(path)
+
+    def _encode(self, batch):
+        data = "".join(
+            f'{{"collection": {json.dumps(name)}, "doc": {bson_dumps(doc)}}}\n' for name, doc in batch
+        ).encode("utf-8")
+        closed = []
+        # Worst case gzip does not shrink the data at all, so check before writing
+        if self._raw and self._raw.tell() and self._raw.tell() + len(data) > self.volume_size:
+            closed.append(self._close_volume())
+        if self._gzip is None:
+            self._volume += 1
+            self._path = os.path.join(self.directory, f"{self.prefix}.part{self._volume:03d}.ndjson.gz")
+            self._raw = open(self._path, "wb")
+            self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        self._gzip.write(data)
+        self._gzip.flush()
+        return closed
+
+    def _close_volume(self):
+        if self._gzip is None:
+            return None
+        self._gzip.close()
+        self._raw.close()
+        path = self._path
+        self._gzip = self._raw = self._path = None
+        return path
+
+
+def iter_backup_file(path):
+    """Yield (collection name, document) from a backup volume (.ndjson.gz) or a legacy .zip export."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                with zf.open(info) as f:
+                    if name.endswith('.jsonl'):
+                        for line in io.TextIOWrapper(f, encoding='utf-8'):
+                            if line.strip():
+                                yield name[:-len('.jsonl')], json_util.loads(line)
+                    elif name.endswith('.bson'):
+                        for doc in bson.decode_file_iter(f):
+                            yield name[:-len('.bson')], doc
+        return
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json_util.loads(line)
+                yield entry['collection'], entry['doc']
+
+
+async def restore_backup(path, batch_size=1000, concurrency=4):
+    """Upsert every document of a backup file into its collection.
+
+    The file is parsed in a worker thread, batch by batch, and each
+    collection's documents are written as unordered ReplaceOne upserts with
+    up to `concurrency` bulk_writes in flight. Returns a stats dict.
+    """
+    collections = {collection.name: collection for collection in backup_collections()}
+    counts = {}
+    skipped = 0
+    errors = []
+    buffers = {}
+    pending = set()
+    sem = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+
+    async def write(name, docs):
+        try:
+            ops = [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in docs]
+            await collections[name].bulk_write(ops, ordered=False)
+            counts[name] = counts.get(name, 0) + len(docs)
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+        finally:
+            sem.release()
+
+    async def submit(name, docs):
+        await sem.acquire()
+        task = asyncio.create_task(write(name, docs))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    entries = iter_backup_file(path)
+    while True:
+        batch = await asyncio.to_thread(lambda: list(itertools.islice(entries, batch_size)))
+        if not batch:
+            break
+        for name, doc in batch:
+            # Unknown collections and export error markers are not restored
+            if name not in collections or '_id' not in doc:
+                skipped += 1
+                continue
+            buffer = buffers.setdefault(name, [])
+            buffer.append(doc)
+            if len(buffer) >= batch_size:
+                buffers[name] = []
+                await submit(name, buffer)
+
+    for name, docs in buffers.items():
+        if docs:
+            await submit(name, docs)
+    if pending:
+        await asyncio.gather(*pending)
+
+    return {
+        'counts': counts,
+        'total': sum(counts.values()),
+        'skipped': skipped,
+        'errors': errors,
+        'seconds': time.monotonic() - started,
+    }
+
+
 def get_flood_wait_seconds(e):
     """Return required wait seconds from FloodWait exception object in a robust way."""
     return int(getattr(e, 'value', getattr(e, 'x', getattr(e, 'wait', 1))))
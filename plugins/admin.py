@@ -28,7 +28,6 @@ async def safe_edit(message, text, reply_markup=None):
 async def add_admins(client: Client, message: Message):
     pro = await message.reply("<b><i>ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ..</i></b>", quote=True)
     check = 0
-    admin_ids = await db.get_all_admins()
     admins = message.text.split()[1:]
 
     reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("ᴄʟᴏsᴇ", callback_data="close")]])
@@ -53,7 +52,7 @@ async def add_admins(client: Client, message: Message):
             admin_list += f"<blockquote><b>Invalid ID: <code>{id}</code></b></blockquote>\n"
             continue
 
-        if id_int in admin_ids:
+        if db.is_admin(id_int):
             admin_list += f"<blockquote><b>ID <code>{id}</code> already exists.</b></blockquote>\n"
             continue
 
@@ -144,7 +143,52 @@ async def manual_backup(client: Bot, message: Message):
             candidate = message.command[1].lower()
             if candidate in ('json', 'bson'):
                 mode = candidate
+        if JOB_WORKER:
+            await db.enqueue_job('backup', chat_id=message.from_user.id, mode=mode)
+            return await safe_edit(pro, f"<b>⏳ Backup ({mode.upper()}) queued, the worker will send it shortly.</b>")
         await client.daily_backup(chat_id=message.from_user.id, mode=mode)
         await safe_edit(pro, f"<b>✅ Backup ({mode.upper()}) sent!</b>")
     except Exception as e:
         await safe_edit(pro, f"<b>❌ Backup failed: {e}</b>")
+
+
+@Bot.on_message(filters.command('restore') & filters.private & filters.user(OWNER_ID))
+async def restore_command(client: Bot, message: Message):
+    import tempfile, shutil
+
+    replied = message.reply_to_message
+    if not replied or not replied.document:
+        return await message.reply(
+            "<b>Reply to a backup file with /restore.</b>\n\n"
+            "Accepted: <code>.ndjson.gz</code> backup parts and older <code>.zip</code> exports.\n"
+            "For an incremental chain, restore the full base first, then each part in order.",
+            quote=True
+        )
+
+    pro = await message.reply("<b><i>ᴅᴏᴡɴʟᴏᴀᴅɪɴɢ ʙᴀᴄᴋᴜᴘ..</i></b>", quote=True)
+    work_dir = tempfile.mkdtemp(prefix="tgdb_restore_")
+    try:
+        path = await replied.download(file_name=os.path.join(work_dir, replied.document.file_name or "backup"))
+        await safe_edit(pro, "<b><i>ʀᴇsᴛᴏʀɪɴɢ..</i></b>")
+        stats = await restore_backup(path)
+
+        # Indexes and in-memory caches must match the restored data
+        await db.ensure_indexes()
+        await db.load_acl()
+        db.invalidate_settings()
+        await channel_registry.refresh()
+
+        rate = stats['total'] / stats['seconds'] if stats['seconds'] else stats['total']
+        lines = "\n".join(f"• <code>{name}</code>: {count}" for name, count in sorted(stats['counts'].items()))
+        text = (
+            f"<b>✅ Restored {stats['total']} documents in {stats['seconds']:.1f}s ({rate:.0f}/s)</b>\n\n"
+            f"{lines or 'Nothing to restore.'}\n\n"
+            f"Skipped: <code>{stats['skipped']}</code>"
+        )
+        if stats['errors']:
+            text += f"\n⚠️ Failed batches: <code>{len(stats['errors'])}</code>\n<blockquote expandable>{stats['errors'][0]}</blockquote>"
+        await safe_edit(pro, text)
+    except Exception as e:
+        await safe_edit(pro, f"<b>❌ Restore failed: {e}</b>")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
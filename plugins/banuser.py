@@ -21,7 +21,6 @@ from database.database import *
 @Bot.on_message(filters.private & filters.command('ban') & admin)
 async def add_banuser(client: Client, message: Message):        
     pro = await message.reply("⏳ <i>Pʀᴏᴄᴇssɪɴɢ ʀᴇǫᴜᴇsᴛ...</i>", quote=True)
-    banuser_ids = await db.get_ban_users()
     banusers = message.text.split()[1:]
 
     reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cʟᴏsᴇ", callback_data="close")]])
@@ -42,11 +41,11 @@ async def add_banuser(client: Client, message: Message):
             report += f"⚠️ Iɴᴠᴀʟɪᴅ ID: <code>{uid}</code>\n"
             continue
 
-        if uid_int in await db.get_all_admins() or uid_int == OWNER_ID:
+        if db.is_admin(uid_int) or uid_int == OWNER_ID:
             report += f"⛔ Sᴋɪᴘᴘᴇᴅ ᴀᴅᴍɪɴ/ᴏᴡɴᴇʀ ID: <code>{uid_int}</code>\n"
             continue
 
-        if uid_int in banuser_ids:
+        if db.is_banned(uid_int):
             report += f"⚠️ Aʟʀᴇᴀᴅʏ : <code>{uid_int}</code>\n"
             continue
 
@@ -95,7 +94,7 @@ async def delete_banuser(client: Client, message: Message):
             report += f"⚠️ Iɴᴀᴠʟɪᴅ ID: <code>{uid}</code>\n"
             continue
 
-        if uid_int in banuser_ids:
+        if db.is_banned(uid_int):
             await db.del_ban_user(uid_int)
             report += f"✅ Uɴʙᴀɴɴᴇᴅ: <code>{uid_int}</code>\n"
         else:
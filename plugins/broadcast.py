@@ -20,52 +20,139 @@ from database.database import *
 
 REPLY_ERROR = "<code>Use this command as a reply to any telegram message without any spaces.</code>"
 
+# Broadcast jobs running in this process
+running_broadcasts = set()
+
+BROADCAST_TITLES = {
+    'pin': "ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴄᴏᴍᴘʟᴇᴛᴇᴅ",
+    'copy': "ʙʀᴏᴀᴅᴄᴀꜱᴛ...",
+    'delete': "Bʀᴏᴀᴅᴄᴀsᴛɪɴɢ ᴡɪᴛʜ Aᴜᴛᴏ-Dᴇʟᴇᴛᴇ...",
+}
+
+#=====================================================================================##
+
+
+def _broadcast_status(job, done=False):
+    title = BROADCAST_TITLES[job['kind']] if done else "ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴘʀᴏᴄᴇꜱꜱɪɴɢ...."
+    return f"""<b><u>{title}</u>
+
+Total Users: <code>{job['total']}</code>
+Successful: <code>{job['successful']}</code>
+Blocked Users: <code>{job['blocked']}</code>
+Deleted Accounts: <code>{job['deleted']}</code>
+Unsuccessful: <code>{job['unsuccessful']}</code></b>"""
+
+
+async def _broadcast_to(client, job, chat_id):
+    """Deliver the broadcast to one user; returns (counter name, sent message id or None)."""
+    # Broadcasts use the BULK lane, so /start deliveries always go first
+    try:
+        sent_msg = await send_gateway.call(
+            BULK, chat_id, client.copy_message, chat_id, job['from_chat_id'], job['message_id']
+        )
+        if job['kind'] == 'pin':
+            await send_gateway.call(
+                BULK, chat_id, client.pin_chat_message,
+                chat_id=chat_id, message_id=sent_msg.id, both_sides=True
+            )
+        return 'successful', sent_msg.id
+    except UserIsBlocked:
+        await db.del_user(chat_id)
+        return 'blocked', None
+    except InputUserDeactivated:
+        await db.del_user(chat_id)
+        return 'deleted', None
+    except Exception as e:
+        print(f"Failed to broadcast to {chat_id}: {e}")
+        return 'unsuccessful', None
+
+async def run_broadcast(client, job_id):
+    """Send a stored broadcast job to every user, resuming after its saved cursor."""
+    if job_id in running_broadcasts:
+        return
+    running_broadcasts.add(job_id)
+    try:
+        job = await db.get_broadcast(job_id)
+        sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        last_edit = 0.0
+
+        async def send(chat_id):
+            async with sem:
+                return await _broadcast_to(client, job, chat_id)
+
+        while True:
+            batch = await db.get_user_ids_page(job['cursor'], BROADCAST_BATCH)
+            if not batch:
+                break
+
+            results = await asyncio.gather(*(send(chat_id) for chat_id in batch))
+            if job['kind'] == 'delete':
+                # The deletion reaper removes these later; sending never waits on the duration
+                delete_at = datetime.utcnow() + timedelta(seconds=job['duration'])
+                await db.schedule_deletions([
+                    {'chat_id': chat_id, 'message_id': sent_id, 'delete_at': delete_at}
+                    for chat_id, (_, sent_id) in zip(batch, results) if sent_id
+                ])
+            results = [status for status, _ in results]
+            inc = {'total': len(batch)}
+            for key in ('successful', 'blocked', 'deleted', 'unsuccessful'):
+                inc[key] = results.count(key)
+            for key, value in inc.items():
+                job[key] += value
+            job['cursor'] = batch[-1]
+            # Checkpoint per batch; a restart resends at most one batch
+            await db.update_broadcast(job_id, inc=inc, cursor=job['cursor'])
+
+            if time.monotonic() - last_edit > 10:
+                last_edit = time.monotonic()
+                try:
+                    await client.edit_message_text(job['chat_id'], job['status_message_id'], _broadcast_status(job))
+                except Exception:
+                    pass
+
+        await db.update_broadcast(job_id, status='done', finished_at=datetime.utcnow())
+        try:
+            await client.edit_message_text(job['chat_id'], job['status_message_id'], _broadcast_status(job, done=True))
+        except Exception as e:
+            print(f"Could not update broadcast status: {e}")
+    except Exception as e:
+        print(f"Broadcast {job_id} stopped: {e}")
+    finally:
+        running_broadcasts.discard(job_id)
+
+
+async def launch_broadcast(client, job_id):
+    """Run a broadcast in this process, or queue it for worker.py when JOB_WORKER is set."""
+    if JOB_WORKER:
+        await db.enqueue_job('broadcast', key=f"broadcast:{job_id}", job_id=job_id)
+    else:
+        asyncio.create_task(run_broadcast(client, job_id))
+
+
+async def resume_broadcasts(client):
+    for job in await db.get_running_broadcasts():
+        await launch_broadcast(client, job['_id'])
+
+
+async def start_broadcast(client, message, kind, duration=None, status_text="<i>ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴘʀᴏᴄᴇꜱꜱɪɴɢ....</i>"):
+    pls_wait = await message.reply(status_text)
+    job_id = await db.create_broadcast(
+        kind=kind,
+        from_chat_id=message.chat.id,
+        message_id=message.reply_to_message.id,
+        duration=duration,
+        chat_id=pls_wait.chat.id,
+        status_message_id=pls_wait.id,
+    )
+    await launch_broadcast(client, job_id)
+
 #=====================================================================================##
 
 
 @Bot.on_message(filters.private & filters.command('pbroadcast') & admin)
 async def send_pin_text(client: Bot, message: Message):
     if message.reply_to_message:
-        query = await db.full_userbase()
-        broadcast_msg = message.reply_to_message
-        total = 0
-        successful = 0
-        blocked = 0
-        deleted = 0
-        unsuccessful = 0
-
-        pls_wait = await message.reply("<i>ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴘʀᴏᴄᴇꜱꜱɪɴɢ....</i>")
-        for chat_id in query:
-            try:
-                # Send and pin the message
-                sent_msg = await broadcast_msg.copy(chat_id)
-                await client.pin_chat_message(chat_id=chat_id, message_id=sent_msg.id, both_sides=True)
-                successful += 1
-            except FloodWait as e:
-                await asyncio.sleep(get_flood_wait_seconds(e))
-                sent_msg = await broadcast_msg.copy(chat_id)
-                await client.pin_chat_message(chat_id=chat_id, message_id=sent_msg.id, both_sides=True)
-                successful += 1
-            except UserIsBlocked:
-                await db.del_user(chat_id)
-                blocked += 1
-            except InputUserDeactivated:
-                await db.del_user(chat_id)
-                deleted += 1
-            except Exception as e:
-                print(f"Failed to send or pin message to {chat_id}: {e}")
-                unsuccessful += 1
-            total += 1
-
-        status = f"""<b><u>ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴄᴏᴍᴘʟᴇᴛᴇᴅ</u></b>
-
-Total Users: <code>{total}</code>
-Successful: <code>{successful}</code>
-Blocked Users: <code>{blocked}</code>
-Deleted Accounts: <code>{deleted}</code>
-Unsuccessful: <code>{unsuccessful}</code>"""
-
-        return await pls_wait.edit(status)
+        await start_broadcast(client, message, 'pin')
 
     else:
         msg = await message.reply("Reply to a message to broadcast and pin it.")
@@ -78,43 +165,7 @@ Unsuccessful: <code>{unsuccessful}</code>"""
 @Bot.on_message(filters.private & filters.command('broadcast') & admin)
 async def send_text(client: Bot, message: Message):
     if message.reply_to_message:
-        query = await db.full_userbase()
-        broadcast_msg = message.reply_to_message
-        total = 0
-        successful = 0
-        blocked = 0
-        deleted = 0
-        unsuccessful = 0
-
-        pls_wait = await message.reply("<i>ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴘʀᴏᴄᴇꜱꜱɪɴɢ....</i>")
-        for chat_id in query:
-            try:
-                await broadcast_msg.copy(chat_id)
-                successful += 1
-            except FloodWait as e:
-                await asyncio.sleep(get_flood_wait_seconds(e))
-                await broadcast_msg.copy(chat_id)
-                successful += 1
-            except UserIsBlocked:
-                await db.del_user(chat_id)
-                blocked += 1
-            except InputUserDeactivated:
-                await db.del_user(chat_id)
-                deleted += 1
-            except:
-                unsuccessful += 1
-                pass
-            total += 1
-
-        status = f"""<b><u>ʙʀᴏᴀᴅᴄᴀꜱᴛ...</u>
-
-Total Users: <code>{total}</code>
-Successful: <code>{successful}</code>
-Blocked Users: <code>{blocked}</code>
-Deleted Accounts: <code>{deleted}</code>
-Unsuccessful: <code>{unsuccessful}</code></b>"""
-
-        return await pls_wait.edit(status)
+        await start_broadcast(client, message, 'copy')
 
     else:
         msg = await message.reply(REPLY_ERROR)
@@ -133,51 +184,9 @@ async def delete_broadcast(client: Bot, message: Message):
             await message.reply("<b>Pʟᴇᴀsᴇ ᴜsᴇ ᴀ ᴠᴀʟɪᴅ ᴅᴜʀᴀᴛɪᴏɴ ɪɴ sᴇᴄᴏɴᴅs.</b> Usᴀɢᴇ: /dbroadcast {duration}")
             return
 
-        query = await db.full_userbase()
-        broadcast_msg = message.reply_to_message
-        total = 0
-        successful = 0
-        blocked = 0
-        deleted = 0
-        unsuccessful = 0
-
-        pls_wait = await message.reply("<i>Broadcast with auto-delete processing....</i>")
-        for chat_id in query:
-            try:
-                sent_msg = await broadcast_msg.copy(chat_id)
-                await asyncio.sleep(duration)  # Wait for the specified duration
-                await sent_msg.delete()  # Delete the message after the duration
-                successful += 1
-            except FloodWait as e:
-                await asyncio.sleep(get_flood_wait_seconds(e))
-                sent_msg = await broadcast_msg.copy(chat_id)
-                await asyncio.sleep(duration)
-                await sent_msg.delete()
-                successful += 1
-            except UserIsBlocked:
-                await db.del_user(chat_id)
-                blocked += 1
-            except InputUserDeactivated:
-                await db.del_user(chat_id)
-                deleted += 1
-            except:
-                unsuccessful += 1
-                pass
-            total += 1
-
-        status = f"""<b><u>Bʀᴏᴀᴅᴄᴀsᴛɪɴɢ ᴡɪᴛʜ Aᴜᴛᴏ-Dᴇʟᴇᴛᴇ...</u>
-
-Total Users: <code>{total}</code>
-Successful: <code>{successful}</code>
-Blocked Users: <code>{blocked}</code>
-Deleted Accounts: <code>{deleted}</code>
-Unsuccessful: <code>{unsuccessful}</code></b>"""
-
-        return await pls_wait.edit(status)
+        await start_broadcast(client, message, 'delete', duration, "<i>Broadcast with auto-delete processing....</i>")
 
     else:
         msg = await message.reply("Pʟᴇᴀsᴇ ʀᴇᴘʟʏ ᴛᴏ ᴀ ᴍᴇssᴀɢᴇ ᴛᴏ ʙʀᴏᴀᴅᴄᴀsᴛ ɪᴛ ᴡɪᴛʜ Aᴜᴛᴏ-Dᴇʟᴇᴛᴇ.")
         await asyncio.sleep(8)
         await msg.delete()
-
-
@@ -3,6 +3,7 @@ from bot import Bot
 from config import *
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from database.database import *
+from helper_func import channel_registry
 
 @Bot.on_callback_query()
 async def cb_handler(client: Bot, query: CallbackQuery):
@@ -62,8 +63,9 @@ async def cb_handler(client: Bot, query: CallbackQuery):
     elif data.startswith("rfs_ch_"):
         cid = int(data.split("_")[2])
         try:
-            chat = await client.get_chat(cid)
-            mode = await db.get_channel_mode(cid)
+            info = channel_registry.get(cid)
+            title = info['title'] or (await client.get_chat(cid)).title
+            mode = info['mode']
             status = "🟢 ᴏɴ" if mode == "on" else "🔴 ᴏғғ"
             new_mode = "ᴏғғ" if mode == "on" else "on"
             buttons = [
@@ -71,7 +73,7 @@ async def cb_handler(client: Bot, query: CallbackQuery):
                 [InlineKeyboardButton("‹ ʙᴀᴄᴋ", callback_data="fsub_back")]
             ]
             await query.message.edit_text(
-                f"Channel: {chat.title}\nCurrent Force-Sub Mode: {status}",
+                f"Channel: {title}\nCurrent Force-Sub Mode: {status}",
                 reply_markup=InlineKeyboardMarkup(buttons)
             )
         except Exception:
@@ -83,10 +85,12 @@ async def cb_handler(client: Bot, query: CallbackQuery):
         mode = "on" if action == "on" else "off"
 
         await db.set_channel_mode(cid, mode)
+        channel_registry.set_mode(cid, mode)
         await query.answer(f"Force-Sub set to {'ON' if mode == 'on' else 'OFF'}")
 
         # Refresh the same channel's mode view
-        chat = await client.get_chat(cid)
+        info = channel_registry.get(cid) or {}
+        title = info.get('title') or (await client.get_chat(cid)).title
         status = "🟢 ON" if mode == "on" else "🔴 OFF"
         new_mode = "off" if mode == "on" else "on"
         buttons = [
@@ -94,21 +98,18 @@ async def cb_handler(client: Bot, query: CallbackQuery):
             [InlineKeyboardButton("‹ ʙᴀᴄᴋ", callback_data="fsub_back")]
         ]
         await query.message.edit_text(
-            f"Channel: {chat.title}\nCurrent Force-Sub Mode: {status}",
+            f"Channel: {title}\nCurrent Force-Sub Mode: {status}",
             reply_markup=InlineKeyboardMarkup(buttons)
         )
 
     elif data == "fsub_back":
-        channels = await db.show_channels()
         buttons = []
-        for cid in channels:
-            try:
-                chat = await client.get_chat(cid)
-                mode = await db.get_channel_mode(cid)
-                status = "🟢" if mode == "on" else "🔴"
-                buttons.append([InlineKeyboardButton(f"{status} {chat.title}", callback_data=f"rfs_ch_{cid}")])
-            except:
+        for cid in channel_registry.ids():
+            info = channel_registry.get(cid)
+            if not info['title']:
                 continue
+            status = "🟢" if info['mode'] == "on" else "🔴"
+            buttons.append([InlineKeyboardButton(f"{status} {info['title']}", callback_data=f"rfs_ch_{cid}")])
 
         await query.message.edit_text(
             "sᴇʟᴇᴄᴛ ᴀ ᴄʜᴀɴɴᴇʟ ᴛᴏ ᴛᴏɢɢʟᴇ ɪᴛs ғᴏʀᴄᴇ-sᴜʙ ᴍᴏᴅᴇ:",
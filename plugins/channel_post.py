@@ -1,29 +1,23 @@
 import asyncio
 from pyrogram import filters, Client
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from pyrogram.errors import FloodWait
-from helper_func import get_flood_wait_seconds
 
 from bot import Bot
 from config import *
-from helper_func import encode, admin
+from helper_func import encode_ids, admin, message_cache, send_gateway, ADMIN
 
-@Bot.on_message(filters.private & admin & ~filters.command(['start', 'commands','users','broadcast','batch', 'custom_batch', 'genlink','stats', 'dlt_time', 'check_dlt_time', 'protect', 'check_protect', 'replace', 'globalcap', 'replace_link', 'replace_all_link', 'caption_add', 'caption_clean', 'caption', 'dbroadcast', 'ban', 'unban', 'banlist', 'addchnl', 'delchnl', 'listchnl', 'fsub_mode', 'pbroadcast', 'add_admin', 'deladmin', 'admins', 'delreq']))
+@Bot.on_message(filters.private & admin & ~filters.command(['start', 'commands','users','broadcast','batch', 'custom_batch', 'genlink','stats', 'dlt_time', 'check_dlt_time', 'protect', 'check_protect', 'replace', 'globalcap', 'replace_link', 'replace_all_link', 'caption_add', 'caption_clean', 'caption', 'dbroadcast', 'ban', 'unban', 'banlist', 'addchnl', 'delchnl', 'listchnl', 'fsub_mode', 'pbroadcast', 'add_admin', 'deladmin', 'admins', 'delreq', 'restore']))
 async def channel_post(client: Client, message: Message):
     reply_text = await message.reply_text("Please Wait...!", quote = True)
     try:
-        post_message = await message.copy(chat_id = client.db_channel.id, disable_notification=True)
-    except FloodWait as e:
-        wait_time = get_flood_wait_seconds(e)
-        await asyncio.sleep(wait_time)
-        post_message = await message.copy(chat_id = client.db_channel.id, disable_notification=True)
+        post_message = await send_gateway.call(
+            ADMIN, client.db_channel.id, message.copy, chat_id = client.db_channel.id, disable_notification=True
+        )
     except Exception as e:
         print(e)
         await reply_text.edit_text("Something went Wrong..!")
         return
-    converted_id = post_message.id * abs(client.db_channel.id)
-    string = f"get-{converted_id}"
-    base64_string = await encode(string)
+    base64_string = encode_ids([post_message.id])
     link = f"https://t.me/{client.username}?start={base64_string}"
 
     reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Share URL", url=f'https://telegram.me/share/url?url={link}')]])
@@ -31,4 +25,5 @@ async def channel_post(client: Client, message: Message):
     await reply_text.edit(f"<b>Here is your link</b>\n\n{link}", reply_markup=reply_markup, disable_web_page_preview = True)
 
     if not DISABLE_CHANNEL_BUTTON:
-        await post_message.edit_reply_markup(reply_markup)
+        await send_gateway.call(ADMIN, client.db_channel.id, post_message.edit_reply_markup, reply_markup)
+        message_cache.invalidate(client.db_channel.id, post_message.id)
@@ -2,11 +2,11 @@
 
 import asyncio
 from pyrogram import Client, filters
-from pyrogram.errors import FloodWait
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from bot import Bot
-from config import DISABLE_CHANNEL_BUTTON
-from helper_func import encode, get_message_id, admin, interactive_users, get_flood_wait_seconds
+from config import DISABLE_CHANNEL_BUTTON, JOB_WORKER
+from database.database import db
+from helper_func import encode_ids, encode_range, encode_manifest, get_message_id, admin, interactive_users, message_cache, send_gateway, ADMIN
 
 
 @Bot.on_message(filters.private & admin & filters.command('batch'))
@@ -86,8 +86,7 @@ async def batch(client: Client, message: Message):
             else:
                 await second_message.reply("❌ Error\nThis is not from DB Channel.")
 
-        string = f"get-{f_msg_id * abs(client.db_channel.id)}-{s_msg_id * abs(client.db_channel.id)}"
-        base64_string = await encode(string)
+        base64_string = encode_range(f_msg_id, s_msg_id)
         link = f"https://t.me/{client.username}?start={base64_string}"
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Share URL", url=f'https://telegram.me/share/url?url={link}')]])
         await second_message.reply_text(
@@ -120,7 +119,7 @@ async def link_generator(client: Client, message: Message):
             else:
                 await channel_message.reply("❌ Error\n\nThis message is not from my DB Channel", quote=True)
 
-        base64_string = await encode(f"get-{msg_id * abs(client.db_channel.id)}")
+        base64_string = encode_ids([msg_id])
         link = f"https://t.me/{client.username}?start={base64_string}"
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Share URL", url=f'https://telegram.me/share/url?url={link}')]])
         await channel_message.reply_text(f"<b>Here is your link</b>\n\n{link}", quote=True, reply_markup=reply_markup)
@@ -128,6 +127,22 @@ async def link_generator(client: Client, message: Message):
         interactive_users.discard(uid)
 
 
+async def add_share_buttons(client, message_ids, link, job_id=None):
+    """Attach the batch's share button to every stored message; job_id reports progress when run by worker.py."""
+    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Share URL", url=f'https://telegram.me/share/url?url={link}')]])
+    for done, mid in enumerate(message_ids, 1):
+        try:
+            await send_gateway.call(
+                ADMIN, client.db_channel.id, client.edit_message_reply_markup,
+                client.db_channel.id, mid, reply_markup=reply_markup
+            )
+            message_cache.invalidate(client.db_channel.id, mid)
+        except Exception:
+            pass
+        if job_id and done % 50 == 0:
+            await db.update_job_progress(job_id, done=done, total=len(message_ids))
+
+
 @Bot.on_message(filters.private & admin & filters.command("custom_batch"))
 async def custom_batch(client: Client, message: Message):
     collected = []
@@ -157,20 +172,13 @@ async def custom_batch(client: Client, message: Message):
                 break
 
             try:
-                while True:
-                    try:
-                        sent = await user_msg.copy(client.db_channel.id, disable_notification=True)
-                        collected.append(sent.id)
-                        await asyncio.sleep(0.4)  # small delay to prevent flood
-                        break
-                    except FloodWait as e:
-                        wait_time = int(getattr(e, "value", 1))
-                        await asyncio.sleep(wait_time)
-                    except Exception as e:
-                        await message.reply(f"❌ Failed to store a message:\n<code>{e}</code>")
-                        break
+                sent = await send_gateway.call(
+                    ADMIN, client.db_channel.id, user_msg.copy,
+                    client.db_channel.id, disable_notification=True, retries=5
+                )
+                collected.append(sent.id)
             except Exception as e:
-                await message.reply(f"❌ Error:\n<code>{e}</code>")
+                await message.reply(f"❌ Failed to store a message:\n<code>{e}</code>")
 
         if cancelled:
             await message.reply("❌ Custom batch cancelled.", reply_markup=ReplyKeyboardRemove())
@@ -182,10 +190,9 @@ async def custom_batch(client: Client, message: Message):
             await message.reply("❌ No messages were added to batch.")
             return
 
-        start_id = collected[0] * abs(client.db_channel.id)
-        end_id = collected[-1] * abs(client.db_channel.id)
-        string = f"get-{start_id}-{end_id}"
-        base64_string = await encode(string)
+        # The manifest keeps the exact ids, so messages stored in between are never delivered
+        code = await db.create_batch_manifest(collected, created_by=uid)
+        base64_string = encode_manifest(code)
         link = f"https://t.me/{client.username}?start={base64_string}"
 
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Share URL", url=f'https://telegram.me/share/url?url={link}')]])
@@ -193,13 +200,10 @@ async def custom_batch(client: Client, message: Message):
 
         # Attach share URL inline button to each message in DB channel (if enabled)
         if not DISABLE_CHANNEL_BUTTON:
-            for mid in collected:
-                try:
-                    await client.edit_message_reply_markup(client.db_channel.id, mid, reply_markup=reply_markup)
-                except FloodWait as e:
-                    await asyncio.sleep(get_flood_wait_seconds(e))
-                except Exception:
-                    pass
+            if JOB_WORKER:
+                await db.enqueue_job('batch_buttons', message_ids=collected, link=link)
+            else:
+                await add_share_buttons(client, collected, link)
 
     finally:
         interactive_users.discard(uid)
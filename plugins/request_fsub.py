@@ -6,6 +6,7 @@ import time
 from pyrogram import Client, filters, __version__
 from pyrogram.enums import ParseMode, ChatAction, ChatMemberStatus, ChatType
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, ChatMemberUpdated, ChatPermissions
+from pyrogram.errors import FloodWait
 from pyrogram.errors.exceptions.bad_request_400 import UserNotParticipant, InviteHashEmpty, ChatAdminRequired, PeerIdInvalid, UserIsBlocked, InputUserDeactivated, UserNotParticipant
 from bot import Bot
 from config import *
@@ -16,20 +17,19 @@ from database.database import *
 @Bot.on_message(filters.command('fsub_mode') & filters.private & admin)
 async def change_force_sub_mode(client: Client, message: Message):
     temp = await message.reply("<b><i>ᴡᴀɪᴛ ᴀ sᴇᴄ..</i></b>", quote=True)
-    channels = await db.show_channels()
+    channels = channel_registry.ids()
 
     if not channels:
         return await temp.edit("<b>❌ No force-sub channels found.</b>")
 
     buttons = []
     for ch_id in channels:
-        try:
-            chat = await client.get_chat(ch_id)
-            mode = await db.get_channel_mode(ch_id)
-            status = "🟢" if mode == "on" else "🔴"
-            title = f"{status} {chat.title}"
+        info = channel_registry.get(ch_id)
+        if info['title']:
+            status = "🟢" if info['mode'] == "on" else "🔴"
+            title = f"{status} {info['title']}"
             buttons.append([InlineKeyboardButton(title, callback_data=f"rfs_ch_{ch_id}")])
-        except:
+        else:
             buttons.append([InlineKeyboardButton(f"⚠️ {ch_id} (Unavailable)", callback_data=f"rfs_ch_{ch_id}")])
 
     buttons.append([InlineKeyboardButton("Close ✖️", callback_data="close")])
@@ -41,39 +41,41 @@ async def change_force_sub_mode(client: Client, message: Message):
     )
 
 # This handler captures membership updates (like when a user leaves, banned)
-@Bot.on_chat_member_updated()
+# Updates from chats outside the force-sub registry never reach the handler
+@Bot.on_chat_member_updated(fsub_channel)
 async def handle_Chatmembers(client, chat_member_updated: ChatMemberUpdated):    
     chat_id = chat_member_updated.chat.id
 
-    if await db.reqChannel_exist(chat_id):
-        old_member = chat_member_updated.old_chat_member
+    # Joins, leaves and bans all change the cached force-sub result
+    for member in (chat_member_updated.old_chat_member, chat_member_updated.new_chat_member):
+        if member and member.user:
+            invalidate_membership(member.user.id, chat_id)
+
+    old_member = chat_member_updated.old_chat_member
 
-        if not old_member:
-            return
+    if not old_member:
+        return
 
-        if old_member.status == ChatMemberStatus.MEMBER:
-            user_id = old_member.user.id
+    if old_member.status == ChatMemberStatus.MEMBER:
+        user_id = old_member.user.id
 
-            if await db.req_user_exist(chat_id, user_id):
-                await db.del_req_user(chat_id, user_id)
+        if await db.req_user_exist(chat_id, user_id):
+            await db.del_req_user(chat_id, user_id)
 
 
 # This handler will capture any join request to the channel/group where the bot is an admin
-@Bot.on_chat_join_request()
+@Bot.on_chat_join_request(fsub_channel)
 async def handle_join_request(client, chat_join_request):
     chat_id = chat_join_request.chat.id
     user_id = chat_join_request.from_user.id
 
     #print(f"[JOIN REQUEST] User {user_id} sent join request to {chat_id}")
 
-    # Print the result of db.reqChannel_exist to check if the channel exists
-    channel_exists = await db.reqChannel_exist(chat_id)
-    #print(f"Channel {chat_id} exists in the database: {channel_exists}")
-
-    if channel_exists:
-        if not await db.req_user_exist(chat_id, user_id):
-            await db.req_user(chat_id, user_id)
-            #print(f"Added user {user_id} to request list for {chat_id}")
+    # Bursts of join requests are written together in one bulk_write
+    await db.queue_req_user(chat_id, user_id)
+    #print(f"Added user {user_id} to request list for {chat_id}")
+    invalidate_membership(user_id, chat_id)
+    resolve_join_request(chat_id, user_id)
 
 # Add channel
 @Bot.on_message(filters.command('addchnl') & filters.private & admin)
@@ -91,8 +93,7 @@ async def add_force_sub(client: Client, message: Message):
     except ValueError:
         return await temp.edit("❌ Invalid chat ID!")
 
-    all_chats = await db.show_channels()
-    if chat_id in [c if isinstance(c, int) else c[0] for c in all_chats]:
+    if chat_id in channel_registry:
         return await temp.edit(f"Already exists:\n<code>{chat_id}</code>")
 
     try:
@@ -111,6 +112,7 @@ async def add_force_sub(client: Client, message: Message):
             link = f"https://t.me/{chat.username}" if chat.username else f"https://t.me/c/{str(chat.id)[4:]}"
 
         await db.add_channel(chat_id)
+        await channel_registry.refresh()
         return await temp.edit(
             f"✅ Added Successfully!\n\n"
             f"<b>Name:</b> <a href='{link}'>{chat.title}</a>\n"
@@ -154,7 +156,8 @@ async def del_force_sub(client: Client, message: Message):
         if not all_channels:
             return await temp.edit("<b>❌ No force-sub channels found.</b>")
         for ch_id in all_channels:
-            await db.del_channel(ch_id)
+            await db.rem_channel(ch_id)
+        await channel_registry.refresh()
         return await temp.edit("<b>✅ All force-sub channels have been removed.</b>")
 
     try:
@@ -164,6 +167,7 @@ async def del_force_sub(client: Client, message: Message):
 
     if ch_id in all_channels:
         await db.rem_channel(ch_id)
+        await channel_registry.refresh()
         return await temp.edit(f"<b>✅ Channel removed:</b> <code>{ch_id}</code>")
     else:
         return await temp.edit(f"<b>❌ Channel not found in force-sub list:</b> <code>{ch_id}</code>")
@@ -172,17 +176,20 @@ async def del_force_sub(client: Client, message: Message):
 @Bot.on_message(filters.command('listchnl') & filters.private & admin)
 async def list_force_sub_channels(client: Client, message: Message):
     temp = await message.reply("<b><i>ᴡᴀɪᴛ ᴀ sᴇᴄ..</i></b>", quote=True)
-    channels = await db.show_channels()
+    channels = channel_registry.ids()
 
     if not channels:
         return await temp.edit("<b>❌ No force-sub channels found.</b>")
 
     result = "<b>⚡ Force-sub Channels:</b>\n\n"
     for ch_id in channels:
+        info = channel_registry.get(ch_id)
         try:
-            chat = await client.get_chat(ch_id)
-            link = chat.invite_link or await client.export_chat_invite_link(chat.id)
-            result += f"<b>•</b> <a href='{link}'>{chat.title}</a> [<code>{ch_id}</code>]\n"
+            if not info['title']:
+                raise ValueError("chat not fetched")
+            link = info['invite_link'] or await client.export_chat_invite_link(ch_id)
+            info['invite_link'] = link
+            result += f"<b>•</b> <a href='{link}'>{info['title']}</a> [<code>{ch_id}</code>]\n"
         except Exception:
             result += f"<b>•</b> <code>{ch_id}</code> — <i>Unavailable</i>\n"
 
@@ -190,59 +197,132 @@ async def list_force_sub_channels(client: Client, message: Message):
 
 
 
-@Bot.on_message(filters.command('delreq') & filters.private & admin)
-async def delete_requested_users(client, message: Message):
-    if len(message.command) < 2:
-        return await message.reply("⚠️ Usᴀɢᴇ: `/delreq <channel_id>`", quote=True)
+# Channels whose /delreq reconciliation is running in this process
+running_delreq = set()
 
-    try:
-        channel_id = int(message.command[1])
-    except ValueError:
-        return await message.reply("❌ Iɴᴠᴀʟɪᴅ ᴄʜᴀɴɴᴇʟ ID.", quote=True)
+DELREQ_PAGE_SIZE = 500
 
-    # Get channel request data
-    channel_data = await db.rqst_fsub_Channel_data.find_one({'_id': channel_id})
-    if not channel_data:
-        return await message.reply("ℹ️ Nᴏ ʀᴇǫᴜᴇsᴛ ᴄʜᴀɴɴᴇʟ ғᴏᴜɴᴅ ғᴏʀ ᴛʜɪs ᴄʜᴀɴɴᴇʟ.", quote=True)
 
-    user_ids = channel_data.get("user_ids", [])
-    if not user_ids:
-        return await message.reply("✅ Nᴏ ᴜsᴇʀs ᴛᴏ ᴘʀᴏᴄᴇss.", quote=True)
-
-    removed = 0
-    skipped = 0
-    left_users = 0
-
-    for user_id in user_ids:
+async def _check_requester(client, channel_id, user_id, sem):
+    """Return 'member', 'left' or 'error' for one stored requester."""
+    async with sem:
         try:
-            member = await client.get_chat_member(channel_id, user_id)
+            # ADMIN lane: a FloodWait pauses every worker, but never /start deliveries
+            member = await send_gateway.call(
+                ADMIN, channel_id, client.get_chat_member, channel_id, user_id, retries=5
+            )
             if member.status in (
                 ChatMemberStatus.MEMBER,
                 ChatMemberStatus.ADMINISTRATOR,
                 ChatMemberStatus.OWNER
             ):
-                skipped += 1  # Still a participant, and in req list
-                continue
-            else:
-                await db.del_req_user(channel_id, user_id)
-                left_users += 1
+                return 'member'
+            return 'left'
         except UserNotParticipant:
-            await db.del_req_user(channel_id, user_id)
-            left_users += 1
+            return 'left'
         except Exception as e:
             print(f"[!] Error checking user {user_id}: {e}")
-            skipped += 1
-
-    for user_id in user_ids:
-        if not await db.req_user_exist(channel_id, user_id):
-            await db.del_req_user(channel_id, user_id)
-            removed += 1
-
-    return await message.reply(
-        f"✅ Cʟᴇᴀɴᴜᴘ ᴄᴏᴍᴘʟᴇᴛᴇᴅ ғᴏʀ ᴄʜᴀɴɴᴇʟ `{channel_id}`\n\n"
-        f"👤 Rᴇᴍᴏᴠᴇᴅ ᴜsᴇʀs ɴᴏᴛ ɪɴ ᴄʜᴀɴɴᴇʟ: `{left_users}`\n"
-        f"🗑️ Rᴇᴍᴏᴠᴇᴅ ʟᴇғᴛᴏᴠᴇʀ ɴᴏɴ-ʀᴇǫᴜᴇsᴛ ᴜsᴇʀs: `{removed}`\n"
-        f"✅ Sᴛɪʟʟ ᴍᴇᴍʙᴇʀs: `{skipped}`",
-        quote=True
+            return 'error'
+
+
+def _delreq_status(channel_id, job, done=False):
+    head = "✅ Cʟᴇᴀɴᴜᴘ ᴄᴏᴍᴘʟᴇᴛᴇᴅ" if done else "⏳ Cʟᴇᴀɴᴜᴘ ʀᴜɴɴɪɴɢ"
+    return (
+        f"{head} ғᴏʀ ᴄʜᴀɴɴᴇʟ <code>{channel_id}</code>\n\n"
+        f"🔎 Cʜᴇᴄᴋᴇᴅ: <code>{job.get('checked', 0)}</code>\n"
+        f"👤 Rᴇᴍᴏᴠᴇᴅ ᴜsᴇʀs ɴᴏᴛ ɪɴ ᴄʜᴀɴɴᴇʟ: <code>{job.get('left', 0)}</code>\n"
+        f"✅ Sᴛɪʟʟ ᴍᴇᴍʙᴇʀs: <code>{job.get('members', 0)}</code>\n"
+        f"⚠️ Eʀʀᴏʀs: <code>{job.get('errors', 0)}</code>"
     )
 
+
+async def run_delreq_job(client, channel_id):
+    """Reconcile a channel's stored join requests, resuming from the saved cursor."""
+    if channel_id in running_delreq:
+        return
+    running_delreq.add(channel_id)
+    try:
+        job = await db.get_delreq_job(channel_id) or {}
+        sem = asyncio.Semaphore(DELREQ_CONCURRENCY)
+        last_edit = 0.0
+
+        while True:
+            page = await db.get_req_users_page(channel_id, job.get('cursor'), DELREQ_PAGE_SIZE)
+            if not page:
+                break
+
+            results = await asyncio.gather(
+                *(_check_requester(client, channel_id, uid, sem) for uid in page)
+            )
+            await db.del_req_users_bulk(channel_id, [uid for uid, state in zip(page, results) if state == 'left'])
+
+            # Checkpoint after every page so a restart picks up from here
+            job['cursor'] = page[-1]
+            job['checked'] = job.get('checked', 0) + len(page)
+            for state, key in (('left', 'left'), ('member', 'members'), ('error', 'errors')):
+                job[key] = job.get(key, 0) + results.count(state)
+            await db.save_delreq_job(
+                channel_id, cursor=job['cursor'], checked=job['checked'],
+                left=job['left'], members=job['members'], errors=job['errors']
+            )
+
+            if job.get('message_id') and time.monotonic() - last_edit > 5:
+                last_edit = time.monotonic()
+                try:
+                    await client.edit_message_text(job['chat_id'], job['message_id'], _delreq_status(channel_id, job))
+                except Exception:
+                    pass
+
+        await db.save_delreq_job(channel_id, status='done')
+        if job.get('message_id'):
+            try:
+                await client.edit_message_text(job['chat_id'], job['message_id'], _delreq_status(channel_id, job, done=True))
+            except Exception as e:
+                print(f"[!] Could not update /delreq status: {e}")
+    except Exception as e:
+        print(f"[!] /delreq job for {channel_id} stopped: {e}")
+    finally:
+        running_delreq.discard(channel_id)
+
+
+async def launch_delreq_job(client, channel_id):
+    """Run a /delreq job in this process, or queue it for worker.py when JOB_WORKER is set."""
+    if JOB_WORKER:
+        await db.enqueue_job('delreq', key=f"delreq:{channel_id}", channel_id=channel_id)
+    else:
+        asyncio.create_task(run_delreq_job(client, channel_id))
+
+
+async def resume_delreq_jobs(client):
+    for job in await db.get_running_delreq_jobs():
+        await launch_delreq_job(client, job['_id'])
+
+
+@Bot.on_message(filters.command('delreq') & filters.private & admin)
+async def delete_requested_users(client, message: Message):
+    if len(message.command) < 2:
+        return await message.reply("⚠️ Usᴀɢᴇ: `/delreq <channel_id>`", quote=True)
+
+    try:
+        channel_id = int(message.command[1])
+    except ValueError:
+        return await message.reply("❌ Iɴᴠᴀʟɪᴅ ᴄʜᴀɴɴᴇʟ ID.", quote=True)
+
+    if channel_id in running_delreq:
+        return await message.reply("⏳ Cʟᴇᴀɴᴜᴘ ɪs ᴀʟʀᴇᴀᴅʏ ʀᴜɴɴɪɴɢ ғᴏʀ ᴛʜɪs ᴄʜᴀɴɴᴇʟ.", quote=True)
+
+    # Get channel request data
+    try:
+        has_requests = await db.get_req_users_page(channel_id, None, 1)
+    except Exception as e:
+        print(f"[!] /delreq could not read requests for {channel_id}: {e}")
+        return await message.reply(f"❌ Could not read join requests:\n<code>{e}</code>", quote=True)
+    if not has_requests:
+        return await message.reply("✅ Nᴏ ᴜsᴇʀs ᴛᴏ ᴘʀᴏᴄᴇss.", quote=True)
+
+    status = await message.reply(_delreq_status(channel_id, {}), quote=True)
+    await db.save_delreq_job(
+        channel_id, status='running', cursor=None, checked=0, left=0, members=0, errors=0,
+        chat_id=status.chat.id, message_id=status.id
+    )
+    await launch_delreq_job(client, channel_id)
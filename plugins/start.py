@@ -4,10 +4,12 @@ import random
 import re
 import sys
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from pyrogram import Client, filters, __version__
 from pyrogram.enums import ParseMode, ChatAction
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, ChatInviteLink, ChatPrivileges
+from pyrogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
 from pyrogram.errors.exceptions.bad_request_400 import UserNotParticipant
 from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated, UserNotParticipant
 from bot import Bot
@@ -26,6 +28,141 @@ CUSTOM_BUTTON = InlineKeyboardMarkup(
 LINK_REGEX = re.compile(r'https?://[^\s]+')
 ANCHOR_TAG_REGEX = re.compile(r'<a\b[^>]*>.*?</a>', re.IGNORECASE | re.DOTALL)
 BRACKETED_LINK_REGEX = re.compile(r'\(\s*https?://[^)]+\)', re.IGNORECASE)
+EMPTY_PARENS_REGEX = re.compile(r'\(\s*\)')
+MULTI_SPACE_REGEX = re.compile(r' {2,}')
+BLANK_LINES_REGEX = re.compile(r'(\n\s*){2,}')
+LINE_PADDING_REGEX = re.compile(r'\s*\n\s*')
+
+CAPTION_MEMO_SIZE = 10000
+
+
+def _strip_caption_links(caption):
+    caption = ANCHOR_TAG_REGEX.sub('', caption)
+    caption = BRACKETED_LINK_REGEX.sub('', caption)
+    caption = LINK_REGEX.sub('', caption)
+    caption = EMPTY_PARENS_REGEX.sub('', caption)
+    caption = MULTI_SPACE_REGEX.sub(' ', caption)
+    caption = BLANK_LINES_REGEX.sub('\n', caption)
+    caption = LINE_PADDING_REGEX.sub('\n', caption)
+    return caption.strip()
+
+
+def compile_caption(settings):
+    """Turn a settings snapshot into a single caption function: msg -> caption or None."""
+    strip_links = settings['strip_links']
+    fallback = settings['global_cap_text'] if settings['global_cap_enabled'] else None
+    rules = []
+    if settings['replace_old']:
+        rules.append(lambda c, old=settings['replace_old'], new=settings['replace_new']: c.replace(old, new))
+    if settings['link_old']:
+        rules.append(lambda c, old=settings['link_old'], new=settings['link_new']: c.replace(old, new))
+    if settings['all_link_enabled'] and settings['all_link']:
+        rules.append(lambda c, link=settings['all_link']: LINK_REGEX.sub(link, c))
+    if settings['caption_append']:
+        rules.append(lambda c, extra=settings['caption_append']: f"{c}\n{extra}")
+
+    def transform(msg):
+        caption = msg.caption.html if msg.caption else ""
+        if strip_links and caption:
+            caption = _strip_caption_links(caption)
+        if CUSTOM_CAPTION and msg.document:
+            caption = CUSTOM_CAPTION.format(previouscaption=caption, filename=msg.document.file_name)
+        if not caption and fallback:
+            caption = fallback
+        if caption:
+            for rule in rules:
+                caption = rule(caption)
+        return caption or None
+
+    return transform
+
+
+class CaptionPipeline:
+    """Caption transform for the current settings version, with results memoized per message.
+
+    The transform is rebuilt only when the settings version changes; a memo
+    entry is reused while the stored caption and file name stay the same.
+    """
+
+    def __init__(self, memo_size):
+        self.memo_size = memo_size
+        self.version = None
+        self.transform = None
+        self.memo = OrderedDict()  # (message_id, version) -> (source, caption)
+
+    def caption_for(self, msg, settings):
+        version = settings['version']
+        if version != self.version:
+            self.transform = compile_caption(settings)
+            self.version = version
+            self.memo.clear()
+
+        key = (msg.id, version)
+        source = (msg.caption, msg.document.file_name if msg.document else None)
+        entry = self.memo.get(key)
+        if entry and entry[0] == source:
+            self.memo.move_to_end(key)
+            return entry[1]
+
+        caption = self.transform(msg)
+        self.memo[key] = (source, caption)
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+        return caption
+
+
+caption_pipeline = CaptionPipeline(CAPTION_MEMO_SIZE)
+
+ALBUM_LIMIT = 10  # Telegram's maximum media group size
+
+
+def _input_media(msg, caption):
+    kwargs = {'caption': caption or "", 'parse_mode': ParseMode.HTML}
+    if msg.photo:
+        return InputMediaPhoto(msg.photo.file_id, **kwargs)
+    if msg.video:
+        return InputMediaVideo(msg.video.file_id, **kwargs)
+    if msg.document:
+        return InputMediaDocument(msg.document.file_id, **kwargs)
+    if msg.audio:
+        return InputMediaAudio(msg.audio.file_id, **kwargs)
+    return None
+
+
+async def _deliver(client, chat_id, unit, settings):
+    """Send one stored message, or one album run as a media group; returns the sent messages."""
+    protect_content = settings['protect_content']
+    if len(unit) > 1:
+        media = [_input_media(msg, caption_pipeline.caption_for(msg, settings)) for msg in unit]
+        if None in media:
+            # Not something a media group can carry; fall back to single copies
+            sent = []
+            for msg in unit:
+                sent.extend(await _deliver(client, chat_id, [msg], settings))
+            return sent
+
+    try:
+        if len(unit) > 1:
+            # Built from file ids, so only the album items inside this link are sent
+            return await send_gateway.call(
+                INTERACTIVE, chat_id, client.send_media_group,
+                chat_id, media, protect_content=protect_content
+            )
+        msg = unit[0]
+        caption = caption_pipeline.caption_for(msg, settings)
+        copy_kwargs = {
+            'chat_id': chat_id,
+            'reply_markup': CUSTOM_BUTTON,
+            'protect_content': protect_content
+        }
+        if caption is not None:
+            copy_kwargs['caption'] = caption
+            copy_kwargs['parse_mode'] = ParseMode.HTML
+        return [await send_gateway.call(INTERACTIVE, chat_id, msg.copy, **copy_kwargs)]
+    except Exception as e:
+        print(f"Failed to send message: {e}")
+        return []
+
 
 BAN_SUPPORT = f"{BAN_SUPPORT}"
 
@@ -33,144 +170,88 @@ BAN_SUPPORT = f"{BAN_SUPPORT}"
 async def start_command(client: Client, message: Message):
     user_id = message.from_user.id
 
-    # Add user if not already present
-    if not await db.present_user(user_id):
-        try:
-            await db.add_user(user_id)
-        except:
-            pass
+    # Add user if not already present (written in the background)
+    db.register_user(user_id)
 
     # Check if user is banned
-    banned_users = await db.get_ban_users()
-    if user_id in banned_users:
-        return await message.reply_text(
+    if db.is_banned(user_id):
+        return await send_gateway.call(
+            INTERACTIVE, message.chat.id, message.reply_text,
             "<b>⛔️ You are Bᴀɴɴᴇᴅ from using this bot.</b>\n\n"
             "<i>Contact support if you think this is a mistake.</i>",
             reply_markup=InlineKeyboardMarkup(
                 [[InlineKeyboardButton("Contact Support", url=BAN_SUPPORT)]]
             )
         )
+    # Payloads are checked (signature included) before any Telegram call
+    ids = None
+    if len(message.command) > 1:
+        ids = parse_link(message.command[1], client.db_channel.id)
+        if isinstance(ids, str):
+            # Batch manifest code: the explicit id list is stored server-side
+            ids = await resolve_manifest(ids)
+        if not ids:
+            return
+
     # ✅ Check Force Subscription
     if not await is_subscribed(client, user_id):
         #await temp.delete()
         return await not_joined(client, message)
 
-    # File auto-delete time in seconds (Set your desired time in seconds here)
-    FILE_AUTO_DELETE = await db.get_del_timer()  # Example: 3600 seconds (1 hour)
-
-    # Protect content setting (initialize from env if not set)
-    if not await db.protect_content_data.find_one({}):
-        initial_protect = True if os.environ.get('PROTECT_CONTENT', "True").lower() == "true" else False
-        await db.set_protect_content(initial_protect)
-    protect_content = await db.get_protect_content()
-    replace_old, replace_new = await db.get_caption_replace()
-    global_cap_text, global_cap_enabled = await db.get_global_caption()
-    link_old, link_new = await db.get_link_replace()
-    all_link, all_link_enabled = await db.get_replace_all_link()
-    caption_append = await db.get_caption_append()
-    strip_links = await db.get_caption_strip()
+    # Delivery settings come from the in-memory snapshot; no DB round trips here
+    settings = await db.get_settings()
+    FILE_AUTO_DELETE = settings['del_timer']
 
     # Handle normal message flow
-    text = message.text
-    if len(text) > 7:
-        try:
-            base64_string = text.split(" ", 1)[1]
-        except IndexError:
-            return
-
-        string = await decode(base64_string)
-        argument = string.split("-")
+    if ids:
+        temp_msg = await send_gateway.call(INTERACTIVE, message.chat.id, message.reply, "<b>Please wait...</b>")
+        neel_msgs = []
+        sends = []
+        sem = asyncio.Semaphore(DELIVERY_CONCURRENCY)
 
-        ids = []
-        if argument[0] == "get" and len(argument) == 2:
-            try:
-                ids = [int(int(argument[1]) / abs(client.db_channel.id))]
-            except Exception as e:
-                print(f"Error decoding ID: {e}")
-                return
-        elif argument[0] == "batch":
-            try:
-                ids = [int(int(a) / abs(client.db_channel.id)) for a in argument[1:]]
-            except Exception as e:
-                print(f"Error decoding IDs: {e}")
-                return
-        elif len(argument) == 3 and argument[0] == "get":
-            # old range format
+        async def send(unit):
             try:
-                start = int(int(argument[1]) / abs(client.db_channel.id))
-                end = int(int(argument[2]) / abs(client.db_channel.id))
-                ids = range(start, end + 1) if start <= end else list(range(start, end - 1, -1))
-            except Exception as e:
-                print(f"Error decoding range: {e}")
-                return
-        else:
-            return
+                return await _deliver(client, message.from_user.id, unit, settings)
+            finally:
+                sem.release()
+
+        async def dispatch(unit):
+            # Waiting for a free slot here keeps the fetch pipeline bounded
+            await sem.acquire()
+            sends.append(asyncio.create_task(send(unit)))
 
-        temp_msg = await message.reply("<b>Please wait...</b>")
         try:
-            messages = await get_messages(client, ids)
+            album = []
+            # Chunks are fetched ahead while earlier files are being sent
+            async for msg in iter_messages(client, ids):
+                if temp_msg:
+                    await send_gateway.call(INTERACTIVE, message.chat.id, temp_msg.delete)
+                    temp_msg = None
+                if album and (msg.media_group_id != album[0].media_group_id or len(album) == ALBUM_LIMIT):
+                    await dispatch(album)
+                    album = []
+                if msg.media_group_id:
+                    album.append(msg)
+                else:
+                    await dispatch([msg])
+            if album:
+                await dispatch(album)
         except Exception as e:
-            await message.reply_text("Something went wrong!")
+            await send_gateway.call(INTERACTIVE, message.chat.id, message.reply_text, "Something went wrong!")
             print(f"Error getting messages: {e}")
-            return
         finally:
-            await temp_msg.delete()
- 
-        neel_msgs = []
-        for msg in messages:
-            original_caption = msg.caption.html if msg.caption else ""
-
-            if strip_links and original_caption:
-                cleaned_caption = ANCHOR_TAG_REGEX.sub('', original_caption)
-                cleaned_caption = BRACKETED_LINK_REGEX.sub('', cleaned_caption)
-                cleaned_caption = LINK_REGEX.sub('', cleaned_caption)
-                cleaned_caption = re.sub(r'\(\s*\)', '', cleaned_caption)
-                cleaned_caption = re.sub(r' {2,}', ' ', cleaned_caption)
-                cleaned_caption = re.sub(r'(\n\s*){2,}', '\n', cleaned_caption)
-                cleaned_caption = re.sub(r'\s*\n\s*', '\n', cleaned_caption)
-                original_caption = cleaned_caption.strip()
-
-            if bool(CUSTOM_CAPTION) and bool(msg.document):
-                base_caption = CUSTOM_CAPTION.format(
-                    previouscaption=original_caption,
-                    filename=msg.document.file_name
-                )
-            else:
-                base_caption = original_caption
-
-            caption = base_caption or ""
-            if not caption and global_cap_enabled and global_cap_text:
-                caption = global_cap_text
-
-            if caption:
-                if replace_old:
-                    caption = caption.replace(replace_old, replace_new)
-                if link_old:
-                    caption = caption.replace(link_old, link_new)
-                if all_link_enabled and all_link:
-                    caption = LINK_REGEX.sub(all_link, caption)
-                if caption_append:
-                    caption = f"{caption}\n{caption_append}"
-
-            caption_to_send = caption or None
-            reply_markup = CUSTOM_BUTTON
-            copy_kwargs = {
-                'chat_id': message.from_user.id,
-                'reply_markup': reply_markup,
-                'protect_content': protect_content
-            }
-            if caption_to_send is not None:
-                copy_kwargs['caption'] = caption_to_send
-                copy_kwargs['parse_mode'] = ParseMode.HTML
-            try:
-                copied_msg = await msg.copy(**copy_kwargs)
-                await asyncio.sleep(0.5)
-                neel_msgs.append(copied_msg)
-            except Exception as e:
-                print(f"Failed to send message: {e}")
+            if temp_msg:
+                await send_gateway.call(INTERACTIVE, message.chat.id, temp_msg.delete)
+
+        for sent in await asyncio.gather(*sends):
+            neel_msgs.extend(sent)
+        # Files already sent still get their auto-delete timer below
+        if not neel_msgs:
+            return
 
         if FILE_AUTO_DELETE > 0:
-            notification_msg = await message.reply(
+            notification_msg = await send_gateway.call(
+                INTERACTIVE, message.chat.id, message.reply,
                 f"<b>Tʜᴇsᴇ Fɪʟᴇs ᴡɪʟʟ ʙᴇ Dᴇʟᴇᴛᴇᴅ ɪɴ  {get_exp_time(FILE_AUTO_DELETE)}. Pʟᴇᴀsᴇ sᴀᴠᴇ ᴏʀ ғᴏʀᴡᴀʀᴅ ᴛʜᴇ sʜᴀʀᴇᴅ ʟɪɴᴋ ᴛᴏ ʏᴏᴜʀ sᴀᴠᴇᴅ ᴍᴇssᴀɢᴇs ʙᴇғᴏʀᴇ ɪᴛ ɢᴇᴛs Dᴇʟᴇᴛᴇᴅ.</b>"
             )
             reload_url = (
@@ -178,9 +259,20 @@ async def start_command(client: Client, message: Message):
                 if message.command and len(message.command) > 1
                 else None
             )
-            asyncio.create_task(
-                schedule_auto_delete(client, neel_msgs, notification_msg, FILE_AUTO_DELETE, reload_url)
-            )
+            # Stored in Mongo and handled by the deletion reaper, so restarts lose nothing
+            delete_at = datetime.utcnow() + timedelta(seconds=FILE_AUTO_DELETE)
+            entries = [
+                {'chat_id': snt_msg.chat.id, 'message_id': snt_msg.id, 'delete_at': delete_at}
+                for snt_msg in neel_msgs if snt_msg
+            ]
+            entries.append({
+                'chat_id': notification_msg.chat.id,
+                'message_id': notification_msg.id,
+                'delete_at': delete_at,
+                'action': 'notify',
+                'reload_url': reload_url,
+            })
+            await db.schedule_deletions(entries)
     else:
         reply_markup = InlineKeyboardMarkup(
             [
@@ -193,7 +285,8 @@ async def start_command(client: Client, message: Message):
     ]
             ]
         )
-        await message.reply_photo(
+        await send_gateway.call(
+            INTERACTIVE, message.chat.id, message.reply_photo,
             photo=START_PIC,
             caption=START_MSG.format(
                 first=message.from_user.first_name,
@@ -209,62 +302,57 @@ async def start_command(client: Client, message: Message):
 
 
 
-# Create a global dictionary to store chat data
-chat_data_cache = {}
+async def _fsub_button(client: Client, chat_id: int, user_id: int):
+    info = channel_registry.get(chat_id) or {}
+    mode = info.get('mode', "off")
+    name, username = info.get('title'), info.get('username')
+
+    if not name:
+        # Registry has not fetched this chat yet
+        data = await client.get_chat(chat_id)
+        name, username = data.title, data.username
+
+    # Links come from the pre-generated pool instead of one RPC per prompt
+    if mode == "on" and not username:
+        link = await invite_links.get(client, chat_id, True)
+        expect_join_request(chat_id, user_id)
+    elif username:
+        link = f"https://t.me/{username}"
+    else:
+        link = await invite_links.get(client, chat_id, False)
+
+    return InlineKeyboardButton(text=name, url=link)
+
 
 async def not_joined(client: Client, message: Message):
-    temp = await message.reply("<b><i>ᴡᴀɪᴛ ᴀ sᴇᴄ..</i></b>")
+    temp = await send_gateway.call(INTERACTIVE, message.chat.id, message.reply, "<b><i>ᴡᴀɪᴛ ᴀ sᴇᴄ..</i></b>")
 
     user_id = message.from_user.id
     buttons = []
     count = 0
 
     try:
-        all_channels = await db.show_channels()  # Should return list of (chat_id, mode) tuples
-        for total, chat_id in enumerate(all_channels, start=1):
-            mode = await db.get_channel_mode(chat_id)  # fetch mode 
-
-            await message.reply_chat_action(ChatAction.TYPING)
-
-            if not await is_sub(client, user_id, chat_id):
-                try:
-                    # Cache chat info
-                    if chat_id in chat_data_cache:
-                        data = chat_data_cache[chat_id]
-                    else:
-                        data = await client.get_chat(chat_id)
-                        chat_data_cache[chat_id] = data
-
-                    name = data.title
-
-                    # Generate proper invite link based on the mode
-                    if mode == "on" and not data.username:
-                        invite = await client.create_chat_invite_link(
-                            chat_id=chat_id,
-                            creates_join_request=True,
-                            expire_date=datetime.utcnow() + timedelta(seconds=FSUB_LINK_EXPIRY) if FSUB_LINK_EXPIRY else None
-                            )
-                        link = invite.invite_link
-
-                    else:
-                        if data.username:
-                            link = f"https://t.me/{data.username}"
-                        else:
-                            invite = await client.create_chat_invite_link(
-                                chat_id=chat_id,
-                                expire_date=datetime.utcnow() + timedelta(seconds=FSUB_LINK_EXPIRY) if FSUB_LINK_EXPIRY else None)
-                            link = invite.invite_link
-
-                    buttons.append([InlineKeyboardButton(text=name, url=link)])
-                    count += 1
-                    await temp.edit(f"<b>{'! ' * count}</b>")
-
-                except Exception as e:
-                    print(f"Error with chat {chat_id}: {e}")
-                    return await temp.edit(
-                        f"<b><i>! Eʀʀᴏʀ, Cᴏɴᴛᴀᴄᴛ ᴅᴇᴠᴇʟᴏᴘᴇʀ ᴛᴏ sᴏʟᴠᴇ ᴛʜᴇ ɪssᴜᴇs @neel_leen</i></b>\n"
-                        f"<blockquote expandable><b>Rᴇᴀsᴏɴ:</b> {e}</blockquote>"
-                    )
+        # Membership results are shared with is_subscribed through the cache
+        unjoined = await get_unjoined_channels(client, user_id)
+        await send_gateway.call(INTERACTIVE, message.chat.id, message.reply_chat_action, ChatAction.TYPING)
+
+        results = await asyncio.gather(
+            *(_fsub_button(client, chat_id, user_id) for chat_id in unjoined),
+            return_exceptions=True
+        )
+        for chat_id, result in zip(unjoined, results):
+            if isinstance(result, Exception):
+                print(f"Error with chat {chat_id}: {result}")
+                return await send_gateway.call(
+                    INTERACTIVE, message.chat.id, temp.edit,
+                    f"<b><i>! Eʀʀᴏʀ, Cᴏɴᴛᴀᴄᴛ ᴅᴇᴠᴇʟᴏᴘᴇʀ ᴛᴏ sᴏʟᴠᴇ ᴛʜᴇ ɪssᴜᴇs @neel_leen</i></b>\n"
+                    f"<blockquote expandable><b>Rᴇᴀsᴏɴ:</b> {result}</blockquote>"
+                )
+            buttons.append([result])
+            count += 1
+
+        if count:
+            await send_gateway.call(INTERACTIVE, message.chat.id, temp.edit, f"<b>{'! ' * count}</b>")
 
         # Retry Button
         try:
@@ -277,7 +365,8 @@ async def not_joined(client: Client, message: Message):
         except IndexError:
             pass
 
-        await message.reply_photo(
+        await send_gateway.call(
+            INTERACTIVE, message.chat.id, message.reply_photo,
             photo=FORCE_PIC,
             caption=FORCE_MSG.format(
                 first=message.from_user.first_name,
@@ -291,7 +380,8 @@ async def not_joined(client: Client, message: Message):
 
     except Exception as e:
         print(f"Final Error: {e}")
-        await temp.edit(
+        await send_gateway.call(
+            INTERACTIVE, message.chat.id, temp.edit,
             f"<b><i>! Eʀʀᴏʀ, Cᴏɴᴛᴀᴄᴛ ᴅᴇᴠᴇʟᴏᴘᴇʀ ᴛᴏ sᴏʟᴠᴇ ᴛʜᴇ ɪssᴜᴇs @BeingHumanAssociation</i></b>\n"
             f"<blockquote expandable><b>Rᴇᴀsᴏɴ:</b> {e}</blockquote>"
         )
@@ -302,24 +392,3 @@ async def not_joined(client: Client, message: Message):
 async def bcmd(bot: Bot, message: Message):        
     reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("• ᴄʟᴏsᴇ •", callback_data = "close")]])
     await message.reply(text=CMD_TXT, reply_markup = reply_markup, quote= True)
-
-async def schedule_auto_delete(client, neel_msgs, notification_msg, file_auto_delete, reload_url):
-    await asyncio.sleep(file_auto_delete)
-    for snt_msg in neel_msgs:
-        if snt_msg:
-            try:
-                await snt_msg.delete()
-            except Exception as e:
-                print(f"Error deleting message {snt_msg.id}: {e}")
-
-    try:
-        keyboard = InlineKeyboardMarkup(
-            [[InlineKeyboardButton("ɢᴇᴛ ғɪʟᴇ ᴀɢᴀɪɴ!", url=reload_url)]]
-        ) if reload_url else None
-
-        await notification_msg.edit(
-            "<b>ʏᴏᴜʀ ᴠɪᴅᴇᴏ / ꜰɪʟᴇ ɪꜱ ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ !!\n\nᴄʟɪᴄᴋ ʙᴇʟᴏᴡ ʙᴜᴛᴛᴏɴ ᴛᴏ ɢᴇᴛ ʏᴏᴜʀ ᴅᴇʟᴇᴛᴇᴅ ᴠɪᴅᴇᴏ / ꜰɪʟᴇ 👇</b>",
-            reply_markup=keyboard
-        )
-    except Exception as e:
-        print(f"Error updating notification with 'Get File Again' button: {e}")
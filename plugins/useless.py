@@ -35,8 +35,8 @@ WAIT_MSG = "<b>Working....</b>"
 @Bot.on_message(filters.command('users') & filters.private & admin)
 async def get_users(client: Bot, message: Message):
     msg = await client.send_message(chat_id=message.chat.id, text=WAIT_MSG)
-    users = await db.full_userbase()
-    await msg.edit(f"{len(users)} users are using this bot")
+    users = await db.count_users()
+    await msg.edit(f"{users} users are using this bot")
 
 
 #=====================================================================================##
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import socket
+import sys, io
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
+sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8")
+import pyrogram.utils
+from pyrogram import Client
+from pyrogram.enums import ParseMode
+from config import *
+from database.database import db
+from bot import Bot
+from helper_func import send_gateway
+
+pyrogram.utils.MIN_CHANNEL_ID = -1009147483647
+
+
+async def run_broadcast_job(client, job):
+    from plugins.broadcast import run_broadcast
+    job_id = job['payload']['job_id']
+    await run_broadcast(client, job_id)
+    broadcast = await db.get_broadcast(job_id)
+    if broadcast and broadcast['status'] != 'done':
+        raise RuntimeError("broadcast stopped before reaching the last user")
+
+
+async def run_delreq(client, job):
+    from plugins.request_fsub import run_delreq_job
+    channel_id = job['payload']['channel_id']
+    await run_delreq_job(client, channel_id)
+    state = await db.get_delreq_job(channel_id)
+    if state and state.get('status') != 'done':
+        raise RuntimeError("/delreq stopped before checking every requester")
+
+
+async def run_backup(client, job):
+    payload = job['payload']
+    await client.daily_backup(
+        chat_id=payload['chat_id'], mode=payload['mode'],
+        incremental=payload.get('incremental', False), raise_errors=True
+    )
+
+
+async def run_batch_buttons(client, job):
+    from plugins.link_generator import add_share_buttons
+    await add_share_buttons(client, job['payload']['message_ids'], job['payload']['link'], job_id=job['_id'])
+
+
+JOB_RUNNERS = {
+    'broadcast': run_broadcast_job,
+    'delreq': run_delreq,
+    'backup': run_backup,
+    'batch_buttons': run_batch_buttons,
+}
+
+
+class Worker(Client):
+    """Runs queued heavy jobs in its own process and session, away from /start handling.
+
+    It never receives updates; the bot talks to it only through the jobs
+    collection. Jobs are leased, so a crashed worker's jobs are picked up
+    again once their lease runs out.
+    """
+
+    daily_backup = Bot.daily_backup
+
+    def __init__(self):
+        super().__init__(
+            name="Worker",
+            api_hash=API_HASH,
+            api_id=APP_ID,
+            bot_token=TG_BOT_TOKEN,
+            no_updates=True
+        )
+        self.LOGGER = LOGGER
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def start(self):
+        await db.ensure_indexes()
+        # Same bot token as the bot process, so both draw on one flood budget;
+        # keep SEND_RESERVE calls per second free for the bot's /start replies
+        send_gateway.cap(max(SEND_MIN_RATE, SEND_RATE - SEND_RESERVE))
+        await super().start()
+        self.set_parse_mode(ParseMode.HTML)
+        self.username = (await self.get_me()).username
+        self.db_channel = await self.get_chat(CHANNEL_ID)
+        self.LOGGER(__name__).info(f"Job worker {self.worker_id} running")
+
+    async def _heartbeat(self, job_id, task):
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            try:
+                renewed = await db.renew_job_lease(job_id, self.worker_id, JOB_LEASE)
+            except Exception as e:
+                self.LOGGER(__name__).warning(f"Could not renew the lease on job {job_id}: {e}")
+                continue
+            if not renewed:
+                # Another worker may own it by now; running on would repeat its work
+                self.LOGGER(__name__).warning(f"Lost the lease on job {job_id}, stopping it")
+                task.cancel()
+                return
+
+    async def run_job(self, job):
+        runner = JOB_RUNNERS.get(job['kind'])
+        if runner is None:
+            self.LOGGER(__name__).error(f"Job {job['_id']} has unknown kind {job['kind']!r}")
+            await db.fail_job(job['_id'], self.worker_id, f"unknown job kind {job['kind']!r}", 0)
+            return
+
+        task = asyncio.create_task(runner(self, job))
+        heartbeat = asyncio.create_task(self._heartbeat(job['_id'], task))
+        try:
+            await task
+            await db.finish_job(job['_id'], self.worker_id)
+        except asyncio.CancelledError:
+            if not heartbeat.done():
+                raise  # worker shutting down; the lease expires and the job is reclaimed
+            self.LOGGER(__name__).warning(f"Job {job['_id']} ({job['kind']}) stopped after losing its lease")
+        except Exception as e:
+            self.LOGGER(__name__).error(f"Job {job['_id']} ({job['kind']}) failed: {e}")
+            await db.fail_job(job['_id'], self.worker_id, str(e), JOB_MAX_ATTEMPTS)
+        finally:
+            heartbeat.cancel()
+
+    async def run_jobs(self):
+        sem = asyncio.Semaphore(JOB_CONCURRENCY)
+
+        async def run(job):
+            try:
+                await self.run_job(job)
+            finally:
+                sem.release()
+
+        while True:
+            await sem.acquire()
+            try:
+                job = await db.claim_job(self.worker_id, JOB_LEASE, JOB_MAX_ATTEMPTS)
+            except Exception as e:
+                self.LOGGER(__name__).warning(f"Could not poll the job queue: {e}")
+                job = None
+            if job is None:
+                sem.release()
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            asyncio.create_task(run(job))
+
+    def run(self):
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.start())
+        try:
+            loop.run_until_complete(self.run_jobs())
+        except KeyboardInterrupt:
+            self.LOGGER(__name__).info("Shutting down worker...")
+        finally:
+            loop.run_until_complete(self.stop())
+
+
+if __name__ == "__main__":
+    Worker().run()